@@ -1,10 +1,14 @@
 import os
 import sqlite3
-import shutil
 import datetime
 import logging
 import json
-import time
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 # Configure logging
 logging.basicConfig(
@@ -17,13 +21,76 @@ logging.basicConfig(
 )
 logger = logging.getLogger("medadapt_backup")
 
-def create_backup(db_path='medadapt_content.db', backup_dir='backups'):
+# Linux ioctl that makes a file share another's data blocks (a reflink).
+# Only copy-on-write filesystems such as Btrfs and XFS support it.
+FICLONE = getattr(fcntl, 'FICLONE', 0x40049409) if fcntl is not None else None
+
+# Backups are named medadapt_backup_<timestamp>.db
+BACKUP_PREFIX = 'medadapt_backup_'
+BACKUP_TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+
+def _clone_file(src_path, dst_path):
+    """
+    Reflink dst_path to src_path, a metadata-only copy that takes no time
+    whatever the file size. Returns False, leaving no file behind, where
+    the filesystem or platform can't do that.
+    """
+    if FICLONE is None:
+        return False
+    
+    try:
+        with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError as e:
+        logger.info("Reflink clone unavailable: %s", e)
+        try:
+            os.remove(dst_path)
+        except OSError:
+            pass
+        return False
+
+def _clone_snapshot(source, db_path, backup_path, on_snapshot=None):
+    """
+    Reflink the database file if that gives a consistent snapshot
+    
+    The WAL is checkpointed into the main file and writers are locked out
+    for the clone, which is metadata-only, so they wait only briefly; a byte
+    copy is never made under the lock. on_snapshot, if given, is called
+    while the lock is still held. Returns False if the lock could not be
+    taken, the WAL still holds frames or the filesystem can't reflink, in
+    which case the backup API should be used.
+    """
+    try:
+        source.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        source.execute("BEGIN IMMEDIATE")
+    except sqlite3.OperationalError as e:
+        logger.warning("Could not lock database for cloning: %s", e)
+        return False
+    
+    try:
+        wal_path = f"{db_path}-wal"
+        if os.path.exists(wal_path) and os.path.getsize(wal_path) > 0:
+            return False
+        
+        if not _clone_file(db_path, backup_path):
+            return False
+        
+        if on_snapshot is not None:
+            on_snapshot()
+        return True
+    finally:
+        source.rollback()
+
+def create_backup(db_path='medadapt_content.db', backup_dir='backups', on_snapshot=None):
     """
     Create a backup of the SQLite database
     
     Args:
         db_path: Path to the database file
         backup_dir: Directory to store backups
+        on_snapshot: Optional callable run just before the data is copied,
+            after the backup's own WAL checkpoint
         
     Returns:
         Path to the created backup or None if failed
@@ -36,19 +103,35 @@ def create_backup(db_path='medadapt_content.db', backup_dir='backups'):
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_path = os.path.join(backup_dir, f"medadapt_backup_{timestamp}.db")
         
-        logger.info(f"Creating backup of {db_path} to {backup_path}")
+        logger.info("Creating backup of %s to %s", db_path, backup_path)
         
         # Check if source database exists
         if not os.path.exists(db_path):
-            logger.error(f"Database file not found: {db_path}")
+            logger.error("Database file not found: %s", db_path)
             return None
         
-        # Create backup
-        shutil.copy2(db_path, backup_path)
+        # Reflink the file when the filesystem supports it and the snapshot
+        # is consistent, otherwise use SQLite's online backup API. It copies
+        # every page in one step from a single WAL read transaction, so
+        # writers carry on meanwhile; a stepwise copy would restart after
+        # each of their commits and might never finish on a busy server.
+        source = sqlite3.connect(db_path)
+        try:
+            if not _clone_snapshot(source, db_path, backup_path, on_snapshot):
+                logger.info("Falling back to SQLite online backup")
+                if on_snapshot is not None:
+                    on_snapshot()
+                target = sqlite3.connect(backup_path)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
         
         # Verify backup was created successfully
         if os.path.exists(backup_path):
-            logger.info(f"Backup created successfully: {backup_path}")
+            logger.info("Backup created successfully: %s", backup_path)
             
             # Create metadata file
             metadata = {
@@ -66,7 +149,7 @@ def create_backup(db_path='medadapt_content.db', backup_dir='backups'):
             logger.error("Backup creation failed")
             return None
     except Exception as e:
-        logger.error(f"Error creating backup: {str(e)}")
+        logger.error("Error creating backup: %s", e)
         return None
 
 def restore_backup(backup_path, target_path='medadapt_content.db'):
@@ -81,26 +164,17 @@ def restore_backup(backup_path, target_path='medadapt_content.db'):
         Boolean indicating success or failure
     """
     try:
-        logger.info(f"Restoring backup from {backup_path} to {target_path}")
+        logger.info("Restoring backup from %s to %s", backup_path, target_path)
         
         # Check if backup file exists
         if not os.path.exists(backup_path):
-            logger.error(f"Backup file not found: {backup_path}")
+            logger.error("Backup file not found: %s", backup_path)
             return False
         
-        # Create temporary copy of current database if it exists
-        if os.path.exists(target_path):
-            temp_path = f"{target_path}.temp"
-            shutil.copy2(target_path, temp_path)
-            logger.info(f"Created temporary backup of current database: {temp_path}")
-        
+        source = sqlite3.connect(backup_path)
         try:
-            # Copy backup to target location
-            shutil.copy2(backup_path, target_path)
-            
-            # Verify database integrity
-            conn = sqlite3.connect(target_path)
-            cursor = conn.cursor()
+            # Verify backup integrity before touching the current database
+            cursor = source.cursor()
             
             # Check if essential tables exist
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
@@ -110,137 +184,203 @@ def restore_backup(backup_path, target_path='medadapt_content.db'):
             missing_tables = [table for table in required_tables if table not in tables]
             
             if missing_tables:
-                logger.error(f"Restored database missing tables: {', '.join(missing_tables)}")
-                # Rollback to original if tables are missing
-                if os.path.exists(temp_path):
-                    shutil.copy2(temp_path, target_path)
-                    logger.info("Rolled back to original database due to validation failure")
+                logger.error("Backup database missing tables: %s", ', '.join(missing_tables))
                 return False
             
-            conn.close()
-            
-            # Remove temporary backup if restoration was successful
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                
-            logger.info("Database restoration completed successfully")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error during restoration: {str(e)}")
-            
-            # Rollback to original
-            if os.path.exists(temp_path):
-                shutil.copy2(temp_path, target_path)
-                logger.info("Rolled back to original database due to error")
-                
-            return False
-            
+            # Copy the backup into place with the online backup API. The copy
+            # happens in a single transaction on the target, so a failure
+            # leaves the current database untouched.
+            target = sqlite3.connect(target_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+        
+        logger.info("Database restoration completed successfully")
+        return True
+        
     except Exception as e:
-        logger.error(f"Error restoring backup: {str(e)}")
+        logger.error("Error restoring backup: %s", e)
         return False
 
-def list_backups(backup_dir='backups'):
+def _backup_entries(backup_dir):
+    """
+    Return (timestamp, filename, path) for each backup, newest first
+    
+    The timestamp is parsed from the filename, so no file is stat'ed.
+    """
+    entries = []
+    with os.scandir(backup_dir) as it:
+        for entry in it:
+            name = entry.name
+            if not name.startswith(BACKUP_PREFIX) or not name.endswith('.db'):
+                continue
+            
+            try:
+                created = datetime.datetime.strptime(
+                    name[len(BACKUP_PREFIX):-len('.db')], BACKUP_TIMESTAMP_FORMAT
+                ).timestamp()
+            except ValueError:
+                continue
+            
+            entries.append((created, name, entry.path))
+    
+    entries.sort(reverse=True)
+    return entries
+
+def list_backups(backup_dir='backups', limit=None):
     """
     List available database backups
     
     Args:
         backup_dir: Directory containing backups
+        limit: Maximum number of backups to return, newest first
         
     Returns:
         List of dictionaries with backup information
     """
     try:
         if not os.path.exists(backup_dir):
-            logger.warning(f"Backup directory not found: {backup_dir}")
+            logger.warning("Backup directory not found: %s", backup_dir)
             return []
-            
-        backups = []
         
-        # Get all .db files in backup directory
-        backup_files = [f for f in os.listdir(backup_dir) if f.endswith('.db')]
+        backups = []
         
-        for file in backup_files:
-            file_path = os.path.join(backup_dir, file)
-            
-            # Get file metadata
-            creation_time = os.path.getctime(file_path)
-            size = os.path.getsize(file_path)
-            
-            # Get timestamp from filename
-            timestamp = file.replace('medadapt_backup_', '').replace('.db', '')
-            
+        # Only the backups being returned are stat'ed or have metadata read
+        for created, name, path in _backup_entries(backup_dir)[:limit]:
             # Check for metadata file
-            metadata_path = os.path.join(backup_dir, file.replace('.db', '.json'))
+            metadata_path = path[:-len('.db')] + '.json'
             metadata = {}
             
-            if os.path.exists(metadata_path):
-                try:
-                    with open(metadata_path, 'r') as f:
-                        metadata = json.load(f)
-                except:
-                    pass
+            try:
+                with open(metadata_path, 'r') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                # Missing or unreadable metadata file
+                pass
             
             backups.append({
-                'filename': file,
-                'path': file_path,
-                'timestamp': timestamp,
-                'creation_time': creation_time,
-                'size': size,
+                'filename': name,
+                'path': path,
+                'timestamp': name[len(BACKUP_PREFIX):-len('.db')],
+                'creation_time': created,
+                'size': os.stat(path).st_size,
                 'metadata': metadata
             })
         
-        # Sort by creation time (newest first)
-        backups.sort(key=lambda x: x['creation_time'], reverse=True)
-        
         return backups
         
     except Exception as e:
-        logger.error(f"Error listing backups: {str(e)}")
+        logger.error("Error listing backups: %s", e)
         return []
 
-def schedule_backup(interval_hours=24, db_path='medadapt_content.db', backup_dir='backups', max_backups=10):
+def _prune_backups(backup_dir, max_backups):
+    """Remove the oldest backups beyond max_backups"""
+    for _, name, path in _backup_entries(backup_dir)[max_backups:]:
+        try:
+            os.remove(path)
+            # Also remove metadata file if it exists
+            metadata_path = path[:-len('.db')] + '.json'
+            if os.path.exists(metadata_path):
+                os.remove(metadata_path)
+            logger.info("Removed old backup: %s", name)
+        except Exception as e:
+            logger.error("Error removing old backup %s: %s", name, e)
+
+def _data_version(conn):
+    """Return the change counter SQLite reports for the database file"""
+    return conn.execute("PRAGMA data_version").fetchone()[0]
+
+def schedule_backup(interval_hours=24, db_path='medadapt_content.db', backup_dir='backups', max_backups=10,
+                    stop_event=None):
     """
     Schedule regular backups at specified intervals
     
+    A backup is skipped when nothing has been committed to the database
+    since the previous one, so an idle server doesn't copy the same data
+    over and over.
+    
     Args:
         interval_hours: Hours between backups
         db_path: Path to the database file
         backup_dir: Directory to store backups
         max_backups: Maximum number of backups to keep
+        stop_event: Optional threading.Event that ends the schedule when set
         
-    Note: This function blocks and runs indefinitely until interrupted
+    Note: This function blocks until interrupted or stop_event is set;
+    use start_backup_scheduler to run it in the background
     """
-    logger.info(f"Starting scheduled backups every {interval_hours} hours")
+    logger.info("Starting scheduled backups every %s hours", interval_hours)
+    
+    if stop_event is None:
+        stop_event = threading.Event()
+    
+    # PRAGMA data_version on a connection kept open for the whole schedule
+    # changes whenever another connection modifies the file, so an unchanged
+    # value means the database hasn't been written since the last backup.
+    # The value is read before each backup to decide whether to skip it.
+    # The backup's own WAL checkpoint also bumps it, so the value recorded
+    # for a backup is re-read after that checkpoint, just before the data
+    # is copied; when the file is cloned the backup's write lock is held
+    # then, so nothing else can have been committed in between.
+    monitor = None
+    last_version = None
+    snapshot_versions = []
+    
+    def record_snapshot_version():
+        snapshot_versions.append(_data_version(monitor))
     
     try:
         while True:
-            # Create backup
-            create_backup(db_path, backup_dir)
+            if monitor is None and os.path.exists(db_path):
+                monitor = sqlite3.connect(db_path)
+            
+            current_version = _data_version(monitor) if monitor is not None else None
+            snapshot_versions.clear()
             
-            # Prune old backups if needed
-            backups = list_backups(backup_dir)
-            if len(backups) > max_backups:
-                # Remove oldest backups
-                for backup in backups[max_backups:]:
-                    try:
-                        os.remove(backup['path'])
-                        # Also remove metadata file if it exists
-                        metadata_path = backup['path'].replace('.db', '.json')
-                        if os.path.exists(metadata_path):
-                            os.remove(metadata_path)
-                        logger.info(f"Removed old backup: {backup['filename']}")
-                    except Exception as e:
-                        logger.error(f"Error removing old backup {backup['filename']}: {str(e)}")
+            if monitor is not None and last_version == current_version:
+                logger.info("Database unchanged since last backup, skipping")
+            elif create_backup(db_path, backup_dir,
+                               on_snapshot=record_snapshot_version if monitor is not None else None):
+                # Without a snapshot reading, fall back to the value read
+                # before the backup; at worst the next backup is redundant
+                last_version = snapshot_versions[-1] if snapshot_versions else current_version
+                
+                # Prune old backups if needed
+                _prune_backups(backup_dir, max_backups)
             
-            # Sleep until next backup
-            logger.info(f"Next backup scheduled in {interval_hours} hours")
-            time.sleep(interval_hours * 3600)
+            # Wait until next backup
+            logger.info("Next backup scheduled in %s hours", interval_hours)
+            if stop_event.wait(interval_hours * 3600):
+                logger.info("Backup scheduling stopped")
+                break
             
     except KeyboardInterrupt:
         logger.info("Backup scheduling stopped by user")
     except Exception as e:
-        logger.error(f"Error in backup scheduling: {str(e)}")
+        logger.error("Error in backup scheduling: %s", e)
+    finally:
+        if monitor is not None:
+            monitor.close()
+
+def start_backup_scheduler(interval_hours=24, db_path='medadapt_content.db', backup_dir='backups', max_backups=10):
+    """
+    Run schedule_backup on a background daemon thread
+    
+    Returns:
+        threading.Event that stops the scheduler when set
+    """
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=schedule_backup,
+        args=(interval_hours, db_path, backup_dir, max_backups, stop_event),
+        name="medadapt-backup",
+        daemon=True
+    )
+    thread.start()
+    return stop_event
 
 if __name__ == "__main__":
     # When run directly, create a backup
@@ -1,16 +1,75 @@
-import requests
-import xml.etree.ElementTree as ET
-import os
-from dotenv import load_dotenv
+import copy
+import logging
+from functools import partial
+from lxml import etree
+from ncbi_utils import (
+    eutils_url, first_text, get_json, iterparse_url, map_concurrently,
+    memoize_search, release_element, text_xpath
+)
 
-# Load environment variables for API key
-load_dotenv()
-API_KEY = os.getenv('NCBI_API_KEY', '')
+logger = logging.getLogger("medadapt_bookshelf")
+
+# XPath expressions are compiled once and reused across calls
+_BOOK_ID = text_xpath('BookId')
+_BOOK_TITLE = text_xpath('BookTitle')
+_PUBLISHER_NAME = text_xpath('Publisher/PublisherName')
+_CHAPTERS = etree.XPath('.//Chapter[ChapterTitle and ChapterId]')
+_CHAPTER_TITLE = text_xpath('ChapterTitle')
+_CHAPTER_ID = text_xpath('ChapterId')
+_AUTHORS = etree.XPath('AuthorList/Author')
+_LAST_NAME = text_xpath('LastName')
+_FORE_NAME = text_xpath('ForeName')
+_PUB_YEAR = text_xpath('PubDate/Year')
+_SECTION_TITLE = text_xpath('SectionTitle')
+_PARAS = etree.XPath('.//Para')
+
+# Number of distinct (query, max_results) searches kept in memory
+SEARCH_CACHE_SIZE = 256
+
+@memoize_search(SEARCH_CACHE_SIZE)
+def _cached_search(query, max_results):
+    """Run a search, raising on failure so errors are never cached"""
+    # Step 1: Search for book IDs
+    search_url = eutils_url('esearch', db='books', term=query, retmode='json', retmax=max_results)
+    data = get_json(search_url)
+    
+    book_ids = data.get('esearchresult', {}).get('idlist')
+    if not book_ids:
+        return ()
+    
+    # Step 2: Fetch book details
+    fetch_url = eutils_url('efetch', db='books', id=','.join(book_ids), retmode='xml')
+    # Parse XML response one <Book> at a time
+    books = []
+
+    for _, book in iterparse_url(fetch_url, events=('end',), tag='Book'):
+        book_id = first_text(_BOOK_ID, book)
+        if book_id is None:
+            release_element(book)
+            continue
+
+        books.append({
+            'id': f"bookshelf-{book_id}",
+            'title': first_text(_BOOK_TITLE, book, "Unknown Title"),
+            'publisher': first_text(_PUBLISHER_NAME, book),
+            'source_type': 'bookshelf',
+            'source_id': book_id,
+            'content_type': 'textbook',
+            'url': f"https://www.ncbi.nlm.nih.gov/books/{book_id}/"
+        })
+        release_element(book)
+
+    return tuple(books)
 
 def search_bookshelf(query, max_results=10):
     """
     Search NCBI Bookshelf for textbook content
     
+    Results are cached in memory for SEARCH_CACHE_TTL seconds, so repeating
+    a search soon after skips the HTTP cache and parsing.
+    Failed searches are not cached; search_bookshelf.cache_clear() empties
+    the cache.
+    
     Args:
         query: Search terms
         max_results: Maximum number of results to return
@@ -18,57 +77,15 @@ def search_bookshelf(query, max_results=10):
     Returns:
         List of book metadata
     """
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-    api_params = f"&api_key={API_KEY}" if API_KEY else ""
-    
-    # Step 1: Search for book IDs
-    search_url = f"{base_url}esearch.fcgi?db=books&term={query}&retmode=json&retmax={max_results}{api_params}"
-    
     try:
-        response = requests.get(search_url)
-        data = response.json()
-        
-        if 'esearchresult' not in data or 'idlist' not in data['esearchresult']:
-            return []
-            
-        book_ids = data['esearchresult']['idlist']
-        
-        if not book_ids:
-            return []
-        
-        # Step 2: Fetch book details
-        fetch_url = f"{base_url}efetch.fcgi?db=books&id={','.join(book_ids)}&retmode=xml{api_params}"
-        fetch_response = requests.get(fetch_url)
-        
-        # Parse XML response
-        root = ET.fromstring(fetch_response.text)
-        books = []
-        
-        for book in root.findall('.//Book'):
-            book_id_elem = book.find('.//BookId')
-            if book_id_elem is None:
-                continue
-                
-            book_id = book_id_elem.text
-            
-            title_elem = book.find('.//BookTitle')
-            publisher_elem = book.find('.//Publisher/PublisherName')
-            
-            books.append({
-                'id': f"bookshelf-{book_id}",
-                'title': title_elem.text if title_elem is not None else "Unknown Title",
-                'publisher': publisher_elem.text if publisher_elem is not None else None,
-                'source_type': 'bookshelf',
-                'source_id': book_id,
-                'content_type': 'textbook',
-                'url': f"https://www.ncbi.nlm.nih.gov/books/{book_id}/"
-            })
-        
-        return books
+        # Callers get their own copy so they can't alter the cached results
+        return copy.deepcopy(list(_cached_search(query, max_results)))
     except Exception as e:
-        print(f"Error searching Bookshelf: {e}")
+        logger.error("Error searching Bookshelf: %s", e)
         return []
 
+search_bookshelf.cache_clear = _cached_search.cache_clear
+
 def fetch_bookshelf_content(book_id):
     """
     Fetch complete book details and chapter list
@@ -79,55 +96,48 @@ def fetch_bookshelf_content(book_id):
     Returns:
         Book details with chapter list
     """
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-    api_params = f"&api_key={API_KEY}" if API_KEY else ""
-    
-    fetch_url = f"{base_url}efetch.fcgi?db=books&id={book_id}&retmode=xml{api_params}"
+    fetch_url = eutils_url('efetch', db='books', id=book_id, retmode='xml')
     
     try:
-        response = requests.get(fetch_url)
-        root = ET.fromstring(response.text)
-        
-        book_elem = root.find('.//Book')
+        # Only the first <Book> is needed, so stop parsing once it closes
+        context = iterparse_url(fetch_url, events=('end',), tag='Book')
+        _, book_elem = next(context, (None, None))
+        context.close()
+
         if book_elem is None:
             return {"error": "Book not found"}
-        
-        title_elem = book_elem.find('.//BookTitle')
-        publisher_elem = book_elem.find('.//Publisher/PublisherName')
-        
+
         # Get chapter information
-        chapters = []
-        for chapter_elem in book_elem.findall('.//Chapter'):
-            chapter_title = chapter_elem.find('.//ChapterTitle')
-            chapter_id = chapter_elem.find('.//ChapterId')
-            
-            if chapter_title is not None and chapter_id is not None:
-                chapters.append({
-                    'title': chapter_title.text,
-                    'id': chapter_id.text
-                })
-        
+        chapters = [
+            {
+                'title': first_text(_CHAPTER_TITLE, chapter_elem),
+                'id': first_text(_CHAPTER_ID, chapter_elem)
+            }
+            for chapter_elem in _CHAPTERS(book_elem)
+        ]
+
         # Get authors
         authors = []
-        for author_elem in book_elem.findall('.//AuthorList/Author'):
-            last_name = author_elem.find('.//LastName')
-            fore_name = author_elem.find('.//ForeName')
+        for author_elem in _AUTHORS(book_elem):
+            last_name = first_text(_LAST_NAME, author_elem)
+            fore_name = first_text(_FORE_NAME, author_elem)
             if last_name is not None:
-                author_name = last_name.text
+                author_name = last_name
                 if fore_name is not None:
-                    author_name = f"{fore_name.text} {author_name}"
+                    author_name = f"{fore_name} {author_name}"
                 authors.append(author_name)
-        
+
         # Get publication information
-        publication_year = None
-        year_elem = book_elem.find('.//PubDate/Year')
-        if year_elem is not None:
-            publication_year = year_elem.text
-        
+        publication_year = first_text(_PUB_YEAR, book_elem)
+
+        title = first_text(_BOOK_TITLE, book_elem, "Unknown Title")
+        publisher = first_text(_PUBLISHER_NAME, book_elem, "Unknown Publisher")
+        release_element(book_elem)
+
         return {
             'id': f"bookshelf-{book_id}",
-            'title': title_elem.text if title_elem is not None else "Unknown Title",
-            'publisher': publisher_elem.text if publisher_elem is not None else "Unknown Publisher",
+            'title': title,
+            'publisher': publisher,
             'authors': authors,
             'publication_year': publication_year,
             'chapters': chapters,
@@ -137,9 +147,21 @@ def fetch_bookshelf_content(book_id):
             'url': f"https://www.ncbi.nlm.nih.gov/books/{book_id}/"
         }
     except Exception as e:
-        print(f"Error fetching book details: {e}")
+        logger.error("Error fetching book details: %s", e)
         return {"error": f"Error fetching book: {e}"}
 
+def fetch_bookshelf_contents(book_ids):
+    """
+    Fetch details for several books in parallel
+    
+    Args:
+        book_ids: Bookshelf IDs
+        
+    Returns:
+        List of book details, in the same order as book_ids
+    """
+    return map_concurrently(fetch_bookshelf_content, book_ids)
+
 def fetch_chapter_content(book_id, chapter_id):
     """
     Fetch specific chapter content
@@ -151,48 +173,74 @@ def fetch_chapter_content(book_id, chapter_id):
     Returns:
         Chapter content and metadata
     """
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-    api_params = f"&api_key={API_KEY}" if API_KEY else ""
-    
     # Fetch specific chapter
-    fetch_url = f"{base_url}efetch.fcgi?db=books&id={book_id}.{chapter_id}&retmode=xml{api_params}"
+    fetch_url = eutils_url('efetch', db='books', id=f"{book_id}.{chapter_id}", retmode='xml')
     
     try:
-        response = requests.get(fetch_url)
-        root = ET.fromstring(response.text)
-        
-        chapter_elem = root.find('.//Chapter')
-        if chapter_elem is None:
-            return {"error": "Chapter not found"}
-        
-        title_elem = chapter_elem.find('.//ChapterTitle')
-        
-        # Extract text content (simplified)
+        # Walk the first <Chapter> section by section so large chapters
+        # are never fully materialized. Slots are reserved on 'start' to
+        # keep sections in document order, filled on 'end', and the
+        # outermost section is freed once it has been read.
+        context = iterparse_url(
+            fetch_url,
+            events=('start', 'end'),
+            tag=('Chapter', 'ChapterTitle', 'Section')
+        )
+        in_chapter = False
+        title = None
         sections = []
-        for section_elem in chapter_elem.findall('.//Section'):
-            section_title = section_elem.find('.//SectionTitle')
-            
-            # Get paragraphs
-            paragraphs = []
-            for para in section_elem.findall('.//Para'):
-                if para.text:
-                    paragraphs.append(para.text)
-            
-            sections.append({
-                'title': section_title.text if section_title is not None else None,
-                'content': '\n\n'.join(paragraphs)
-            })
-        
+        open_sections = []
+
+        for event, elem in context:
+            if elem.tag == 'Chapter':
+                if event == 'end':
+                    break
+                in_chapter = True
+            elif not in_chapter:
+                continue
+            elif elem.tag == 'ChapterTitle':
+                if event == 'end' and title is None:
+                    title = elem.text
+            elif event == 'start':
+                open_sections.append(len(sections))
+                sections.append(None)
+            else:
+                # Get paragraphs
+                paragraphs = [para.text for para in _PARAS(elem) if para.text]
+
+                sections[open_sections.pop()] = {
+                    'title': first_text(_SECTION_TITLE, elem),
+                    'content': '\n\n'.join(paragraphs)
+                }
+                if not open_sections:
+                    release_element(elem)
+
+        if not in_chapter:
+            return {"error": "Chapter not found"}
+
         return {
             'id': f"bookshelf-{book_id}-{chapter_id}",
             'book_id': book_id,
             'chapter_id': chapter_id,
-            'title': title_elem.text if title_elem is not None else "Unknown Chapter",
+            'title': title if title is not None else "Unknown Chapter",
             'sections': sections,
             'content_type': 'chapter',
             'source_type': 'bookshelf',
             'url': f"https://www.ncbi.nlm.nih.gov/books/{book_id}/{chapter_id}/"
         }
     except Exception as e:
-        print(f"Error fetching chapter: {e}")
-        return {"error": f"Error fetching chapter: {e}"} 
\ No newline at end of file
+        logger.error("Error fetching chapter: %s", e)
+        return {"error": f"Error fetching chapter: {e}"}
+
+def fetch_book_chapters(book_id, chapter_ids):
+    """
+    Fetch several chapters of a book in parallel
+    
+    Args:
+        book_id: Bookshelf book ID
+        chapter_ids: Chapter IDs to fetch
+        
+    Returns:
+        List of chapter content, in the same order as chapter_ids
+    """
+    return map_concurrently(partial(fetch_chapter_content, book_id), chapter_ids)
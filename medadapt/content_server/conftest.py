@@ -0,0 +1,57 @@
+import os
+import pytest
+import requests
+import database
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--offline", action="store_true",
+        help="Replay NCBI responses from the HTTP cache and fail on any cache miss"
+    )
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "network: test calls the live NCBI E-utilities API")
+    
+    # ncbi_utils reads MEDADAPT_OFFLINE at import, which test_server defers
+    # until the first network test runs
+    if config.getoption("--offline"):
+        os.environ["MEDADAPT_OFFLINE"] = "1"
+
+def _collected_network_tests(session):
+    """Check whether any collected test is marked network"""
+    return any(item.get_closest_marker("network") for item in session.items)
+
+@pytest.fixture(scope="session", autouse=True)
+def initialized_database(request):
+    """
+    Create the on-disk database schema once per test session
+    
+    Only the network tests use the on-disk database, for the HTTP cache;
+    test_database works on its own throwaway database. Skipped when no
+    network test was collected, so offline runs leave nothing on disk.
+    """
+    if _collected_network_tests(request.session):
+        database.initialize_database()
+
+@pytest.fixture(scope="session", autouse=True)
+def warm_ncbi_connection(request):
+    """
+    Pay the NCBI clients' first-call costs before any network test runs
+    
+    Imports the client modules and opens a pooled keep-alive connection
+    to E-utilities, so DNS, TCP and TLS setup aren't charged to the first
+    test. Skipped in offline mode and when no network test was collected.
+    """
+    if not _collected_network_tests(request.session):
+        return
+    
+    import pubmed_utils, bookshelf_utils
+    import ncbi_utils
+    if ncbi_utils.OFFLINE:
+        return
+    
+    try:
+        ncbi_utils.session.head(ncbi_utils.EUTILS_BASE_URL)
+    except requests.RequestException:
+        # The network tests will report the failure themselves
+        pass
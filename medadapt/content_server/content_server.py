@@ -1,9 +1,16 @@
 from mcp.server.fastmcp import FastMCP
-import json
+import asyncio
+import copy
+import orjson
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 import os
+import re
 import sys
+import threading
+import time
 import traceback
 from dotenv import load_dotenv
 
@@ -27,16 +34,67 @@ try:
     from pubmed_utils import search_pubmed, fetch_pubmed_article
     from bookshelf_utils import search_bookshelf, fetch_bookshelf_content, fetch_chapter_content
 except ImportError as e:
-    logger.error(f"Failed to import required modules: {str(e)}")
+    logger.error("Failed to import required modules: %s", e)
     sys.exit(1)
 
 # Initialize MCP server
 content_server = FastMCP("MedAdapt Content Server")
 
+def _indicator_pattern(indicators):
+    """Compile indicator phrases into one case-insensitive substring pattern"""
+    return re.compile('|'.join(map(re.escape, indicators)), re.IGNORECASE)
+
+# Phrases that mark a sentence as belonging to an extracted category. Each
+# list is matched in a single regex search instead of one scan per phrase.
+_FINDINGS_RE = _indicator_pattern([
+    "we found", "results showed", "demonstrated", "revealed",
+    "observed", "concluded", "findings"
+])
+_METHOD_RE = _indicator_pattern([
+    "method", "study design", "we conducted", "participants",
+    "patients", "subjects", "sample", "procedure", "analysis"
+])
+_IMPLICATIONS_RE = _indicator_pattern([
+    "implications", "clinical", "practice", "treatment",
+    "management", "care", "patients", "therapy", "intervention"
+])
+_CLINICAL_CORRELATION_RE = _indicator_pattern(["clinic", "patient", "disease"])
+_MAIN_POINTS_RE = _indicator_pattern([
+    "important", "significant", "key", "essential", "crucial",
+    "demonstrated", "found", "shows", "reveals", "concludes"
+])
+
+# Sentence boundaries: closing punctuation followed by whitespace and a
+# capital letter, so decimals ("p<0.05") don't split. Common abbreviations
+# that are often followed by a capitalized word are excluded.
+_ABBREVIATIONS = ('e.g.', 'i.e.', 'et al.', 'Fig.', 'vs.', 'cf.', 'Dr.')
+_SENTENCE_BREAK_RE = re.compile(
+    ''.join(rf'(?<!\b{re.escape(abbreviation)})' for abbreviation in _ABBREVIATIONS)
+    + r'(?<=[.!?])\s+(?=[A-Z])'
+)
+
+# Common long words that are never useful key terms
+_STOPWORDS = frozenset({'about', 'these', 'those', 'their', 'there'})
+
+async def _search_source(source_name, search, query, max_results):
+    """Run a blocking external search on a worker thread, returning [] on failure"""
+    if max_results <= 0:
+        return []
+    
+    try:
+        logger.info("Searching %s for '%s'", source_name, query)
+        results = await asyncio.to_thread(search, query, max_results)
+        logger.info("Found %s results from %s", len(results), source_name)
+        return results
+    except Exception as e:
+        logger.error("%s search failed: %s", source_name, e)
+        return []
+
 @content_server.tool()
-def search_medical_content(query: str, specialty: str = None, 
-                          difficulty: str = None, content_type: str = None,
-                          max_results: int = 10) -> list:
+async def search_medical_content(query: str, specialty: str = None, 
+                                difficulty: str = None, content_type: str = None,
+                                max_results: int = 10, local_only: bool = False,
+                                search_content: bool = False) -> list:
     """
     Search for medical educational content based on query and filters.
     
@@ -46,28 +104,47 @@ def search_medical_content(query: str, specialty: str = None,
         difficulty: Optional difficulty level filter
         content_type: Optional content type filter
         max_results: Maximum number of results to return
+        local_only: Skip PubMed and Bookshelf, e.g. when a previous call
+            for the same query has just cached their results
+        search_content: Also match the query against stored content, such
+            as chapter text and the body of imported user documents, not
+            just titles and abstracts
         
     Returns:
         List of matching resources with metadata
     """
     try:
-        logger.info(f"Searching for content with query: '{query}', specialty: {specialty}, difficulty: {difficulty}, content_type: {content_type}")
+        logger.info("Searching for content with query: '%s', specialty: %s, difficulty: %s, content_type: %s", query, specialty, difficulty, content_type)
         
-        # First, check local database
-        local_results = database.search_resources(
+        # First, check local database. SQLite calls block, so they run on a
+        # worker thread to keep the event loop serving other requests.
+        local_results = await asyncio.to_thread(
+            database.search_resources,
             query=query, 
             specialty=specialty, 
             difficulty=difficulty, 
             content_type=content_type, 
-            limit=max_results
+            limit=max_results,
+            search_content=search_content
         )
         
-        logger.info(f"Found {len(local_results)} results in local database")
+        logger.info("Found %s results in local database", len(local_results))
         
         # If we have enough local results, return them
         if len(local_results) >= max_results:
             return local_results
         
+        if local_only:
+            # Stand in for the external searches with the resources they
+            # cached earlier. Like the external searches, this top-up
+            # matches on the query alone.
+            if specialty or difficulty or content_type:
+                seen = {r['id'] for r in local_results}
+                cached = await asyncio.to_thread(database.search_resources, query=query, limit=max_results,
+                                                 search_content=search_content)
+                local_results.extend(r for r in cached if r['id'] not in seen)
+            return local_results[:max_results]
+        
         # Otherwise, search external sources
         remaining_results = max_results - len(local_results)
         
@@ -75,44 +152,124 @@ def search_medical_content(query: str, specialty: str = None,
         pubmed_count = remaining_results // 2
         bookshelf_count = remaining_results - pubmed_count
         
-        # Search PubMed
-        pubmed_results = []
-        if pubmed_count > 0:
-            try:
-                logger.info(f"Searching PubMed for '{query}'")
-                pubmed_results = search_pubmed(query, pubmed_count)
-                logger.info(f"Found {len(pubmed_results)} results from PubMed")
-                
-                # Store results in database for future use
-                for result in pubmed_results:
-                    database.add_resource(result)
-            except Exception as e:
-                logger.error(f"PubMed search failed: {str(e)}")
-                pubmed_results = []
+        # Search PubMed and Bookshelf concurrently
+        pubmed_results, bookshelf_results = await asyncio.gather(
+            _search_source("PubMed", search_pubmed, query, pubmed_count),
+            _search_source("Bookshelf", search_bookshelf, query, bookshelf_count)
+        )
         
-        # Search Bookshelf
-        bookshelf_results = []
-        if bookshelf_count > 0:
+        # Store results in database for future use, in one transaction
+        external_results = pubmed_results + bookshelf_results
+        if external_results:
             try:
-                logger.info(f"Searching Bookshelf for '{query}'")
-                bookshelf_results = search_bookshelf(query, bookshelf_count)
-                logger.info(f"Found {len(bookshelf_results)} results from Bookshelf")
-                
-                # Store results in database for future use
-                for result in bookshelf_results:
-                    database.add_resource(result)
+                await asyncio.to_thread(database.add_resources, external_results)
             except Exception as e:
-                logger.error(f"Bookshelf search failed: {str(e)}")
-                bookshelf_results = []
+                logger.error("Failed to cache search results: %s", e)
         
         # Combine and return results
         all_results = local_results + pubmed_results + bookshelf_results
         return all_results[:max_results]
     except Exception as e:
-        logger.error(f"Error in search_medical_content: {str(e)}")
+        logger.error("Error in search_medical_content: %s", e)
         logger.error(traceback.format_exc())
         return [{"error": f"Search failed: {str(e)}"}]
 
+class _TTLCache:
+    """
+    Thread-safe LRU cache whose entries go stale after ttl seconds
+    
+    Stale entries are still returned so callers can serve them while a
+    fresh value is computed in the background (stale-while-revalidate).
+    """
+    
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (cached_at, value)
+        self._refreshing = set()
+        self._lock = threading.RLock()
+    
+    def get(self, key):
+        """Return (value, stale) for key, or (None, False) on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            
+            self._entries.move_to_end(key)
+            cached_at, value = entry
+            return value, time.monotonic() - cached_at > self.ttl
+    
+    def set(self, key, value):
+        """Store value, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def start_refresh(self, key):
+        """Return True if the caller should refresh key; False if one is running"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+    
+    def finish_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+# In-process cache of get_resource_content results
+RESOURCE_CACHE_SIZE = 1024
+RESOURCE_CACHE_TTL = 3600
+
+# Caches of topic overviews and resource suggestions, keyed by normalized topic
+TOPIC_CACHE_SIZE = 256
+TOPIC_CACHE_TTL = 1800
+
+_resource_cache = _TTLCache(RESOURCE_CACHE_SIZE, RESOURCE_CACHE_TTL)
+_overview_cache = _TTLCache(TOPIC_CACHE_SIZE, TOPIC_CACHE_TTL)
+_suggestion_cache = _TTLCache(TOPIC_CACHE_SIZE, TOPIC_CACHE_TTL)
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="resource-refresh")
+
+# Background refresh tasks, referenced so they aren't garbage collected
+_background_tasks = set()
+
+def _topic_key(topic):
+    return topic.lower().strip()
+
+def _refresh_cached_resource(resource_id):
+    """Reload a stale resource cache entry in the background"""
+    try:
+        content = _load_resource_content(resource_id)
+        if 'error' not in content:
+            _resource_cache.set(resource_id, content)
+    finally:
+        _resource_cache.finish_refresh(resource_id)
+
+def invalidate_resource_cache(resource_id=None):
+    """Drop one resource, or every resource, from the in-process cache"""
+    if resource_id is None:
+        _resource_cache.clear()
+    else:
+        _resource_cache.pop(resource_id)
+
+def clear_caches():
+    """Empty every in-process cache"""
+    _resource_cache.clear()
+    _overview_cache.clear()
+    _suggestion_cache.clear()
+
 @content_server.tool()
 def get_resource_content(resource_id: str) -> dict:
     """
@@ -124,66 +281,99 @@ def get_resource_content(resource_id: str) -> dict:
     Returns:
         Resource object with complete content
     """
+    logger.info("Retrieving content for resource: %s", resource_id)
+    
+    # Callers get their own copy, since some (e.g. _deserialized) add keys
+    # to the resource they are handed
+    content, stale = _resource_cache.get(resource_id)
+    if content is not None:
+        logger.info("Resource %s found in memory cache", resource_id)
+        if stale and _resource_cache.start_refresh(resource_id):
+            _refresh_executor.submit(_refresh_cached_resource, resource_id)
+        return copy.deepcopy(content)
+    
+    content = _load_resource_content(resource_id)
+    if 'error' not in content:
+        _resource_cache.set(resource_id, content)
+        content = copy.deepcopy(content)
+    
+    return content
+
+def _fetch_pubmed_resource(pmid):
+    logger.info("Fetching PubMed article: %s", pmid)
+    return fetch_pubmed_article(pmid)
+
+def _fetch_bookshelf_resource(source_id):
+    # Check if it's a chapter or a book
+    parts = source_id.split('-')
+    if len(parts) > 1:
+        book_id = parts[0]
+        chapter_id = parts[1]
+        logger.info("Fetching Bookshelf chapter: %s/%s", book_id, chapter_id)
+        return fetch_chapter_content(book_id, chapter_id)
+    
+    book_id = parts[0]
+    logger.info("Fetching Bookshelf book: %s", book_id)
+    return fetch_bookshelf_content(book_id)
+
+def _fetch_user_document(source_id):
+    # It's a user document, get from database
+    doc_id = f"user-{source_id}"
+    logger.info("Retrieving user document: %s", doc_id)
+    doc = database.get_user_document(doc_id)
+    if not doc:
+        return {"error": f"User document not found: {doc_id}"}
+    
+    return {
+        'id': doc['id'],
+        'title': doc['title'],
+        'content': doc['content'],
+        'upload_date': doc['upload_date'],
+        'source_type': 'user_provided'
+    }
+
+# Fetchers for resources missing from the database, keyed by the part of
+# the resource ID before the first '-' and given the rest of the ID
+_RESOURCE_FETCHERS = {
+    'pubmed': _fetch_pubmed_resource,
+    'bookshelf': _fetch_bookshelf_resource,
+    'user': _fetch_user_document,
+}
+
+def _load_resource_content(resource_id):
+    """Load a resource from the database, fetching it from its source if needed"""
     try:
-        logger.info(f"Retrieving content for resource: {resource_id}")
-        
         # Check local database first
         resource = database.get_resource(resource_id)
         
         # If resource exists and has cached content, return it
         if resource and resource.get('cached_content'):
-            logger.info(f"Resource {resource_id} found in cache")
+            logger.info("Resource %s found in cache", resource_id)
             return resource
         
         # If not found or no cached content, fetch from source
-        if resource_id.startswith('pubmed-'):
-            pmid = resource_id.replace('pubmed-', '')
-            logger.info(f"Fetching PubMed article: {pmid}")
-            content = fetch_pubmed_article(pmid)
-        elif resource_id.startswith('bookshelf-'):
-            # Check if it's a chapter or a book
-            parts = resource_id.replace('bookshelf-', '').split('-')
-            if len(parts) > 1:
-                book_id = parts[0]
-                chapter_id = parts[1]
-                logger.info(f"Fetching Bookshelf chapter: {book_id}/{chapter_id}")
-                content = fetch_chapter_content(book_id, chapter_id)
-            else:
-                book_id = parts[0]
-                logger.info(f"Fetching Bookshelf book: {book_id}")
-                content = fetch_bookshelf_content(book_id)
-        elif resource_id.startswith('user-doc-'):
-            # It's a user document, get from database
-            logger.info(f"Retrieving user document: {resource_id}")
-            doc = database.get_user_document(resource_id)
-            if doc:
-                content = {
-                    'id': doc['id'],
-                    'title': doc['title'],
-                    'content': doc['content'],
-                    'upload_date': doc['upload_date'],
-                    'source_type': 'user_provided'
-                }
-            else:
-                return {"error": f"User document not found: {resource_id}"}
-        else:
+        kind, _, source_id = resource_id.partition('-')
+        fetch = _RESOURCE_FETCHERS.get(kind)
+        if fetch is None:
             return {"error": f"Unknown resource ID format: {resource_id}"}
         
+        content = fetch(source_id)
+        
         # Store fetched content in database
         if 'error' not in content:
-            logger.info(f"Caching content for resource: {resource_id}")
+            logger.info("Caching content for resource: %s", resource_id)
             database.add_resource(content)
         else:
-            logger.error(f"Error fetching content for {resource_id}: {content.get('error')}")
+            logger.error("Error fetching content for %s: %s", resource_id, content.get('error'))
         
         return content
     except Exception as e:
-        logger.error(f"Error in get_resource_content: {str(e)}")
+        logger.error("Error in get_resource_content: %s", e)
         logger.error(traceback.format_exc())
         return {"error": f"Failed to retrieve resource: {str(e)}"}
 
 @content_server.tool()
-def get_topic_overview(topic: str) -> dict:
+async def get_topic_overview(topic: str) -> dict:
     """
     Generate a comprehensive overview of a medical topic.
     
@@ -193,11 +383,40 @@ def get_topic_overview(topic: str) -> dict:
     Returns:
         Structured overview with definitions, key concepts, and related materials
     """
+    # Callers get their own copy so they can't alter the cached overview
+    key = _topic_key(topic)
+    overview, stale = _overview_cache.get(key)
+    if overview is not None:
+        logger.info("Overview for topic %s found in cache", topic)
+        if stale and _overview_cache.start_refresh(key):
+            task = asyncio.create_task(_refresh_topic_overview(key, topic))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        return copy.deepcopy(overview)
+    
+    overview = await _build_topic_overview(topic)
+    if 'error' not in overview:
+        _overview_cache.set(key, overview)
+        overview = copy.deepcopy(overview)
+    
+    return overview
+
+async def _refresh_topic_overview(key, topic):
+    """Rebuild a stale overview cache entry in the background"""
+    try:
+        overview = await _build_topic_overview(topic)
+        if 'error' not in overview:
+            _overview_cache.set(key, overview)
+    finally:
+        _overview_cache.finish_refresh(key)
+
+async def _build_topic_overview(topic):
+    """Search for resources on a topic and assemble its overview"""
     try:
-        logger.info(f"Generating overview for topic: {topic}")
+        logger.info("Generating overview for topic: %s", topic)
         
         # Search for relevant resources
-        resources = search_medical_content(topic, max_results=5)
+        resources = await search_medical_content(topic, max_results=5)
         
         # Check for errors in resources
         if resources and len(resources) > 0 and 'error' in resources[0]:
@@ -213,7 +432,7 @@ def get_topic_overview(topic: str) -> dict:
         try:
             related_topics = database.get_related_topics(topic)
         except Exception as e:
-            logger.warning(f"Failed to get related topics: {str(e)}")
+            logger.warning("Failed to get related topics: %s", e)
             related_topics = []
         
         # If no related topics found, use simplified fallback
@@ -241,84 +460,103 @@ def get_topic_overview(topic: str) -> dict:
         
         return overview
     except Exception as e:
-        logger.error(f"Error in get_topic_overview: {str(e)}")
+        logger.error("Error in get_topic_overview: %s", e)
         logger.error(traceback.format_exc())
         return {"error": f"Failed to generate topic overview: {str(e)}"}
 
+def _deserialized(resource):
+    """
+    Return a resource's cached_content, parsing it first if it is still JSON
+    
+    The parsed form is kept on the resource so the other extractors that
+    look at the same resource don't parse it again.
+    """
+    content = resource.get('cached_content')
+    if not isinstance(content, (str, bytes)):
+        return content
+    
+    if '_parsed_content' not in resource:
+        try:
+            resource['_parsed_content'] = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            resource['_parsed_content'] = content
+    return resource['_parsed_content']
+
+def _split_sentences(text, limit=0):
+    """
+    Split text into sentences that keep their closing punctuation
+    
+    With a limit, only the first `limit` sentences are split off and returned.
+    """
+    sentences = _SENTENCE_BREAK_RE.split(text.strip(), limit)
+    if limit and len(sentences) > limit:
+        return sentences[:limit]
+    
+    if sentences[-1] and sentences[-1][-1] not in '.!?':
+        sentences[-1] += '.'
+    return sentences
+
+# Definitions are looked for only in the opening sentences of each text
+DEFINITION_SENTENCE_WINDOW = 3
+
+def _definition_texts(resource):
+    """Yield the texts of a resource that may open with a definition, in search order"""
+    # Check abstract first for PubMed articles
+    if resource.get('abstract'):
+        yield resource['abstract']
+    
+    # Check cached content
+    content = _deserialized(resource)
+    if isinstance(content, dict):
+        if content.get('abstract'):
+            yield content['abstract']
+        
+        # Check sections (for book chapters)
+        for section in content.get('sections') or ():
+            if section.get('content'):
+                yield section['content']
+
+def _candidate_definitions(topic, resources):
+    """Lazily yield sentences that mention topic near the start of a text"""
+    topic_lower = topic.lower()
+    for resource in resources:
+        for text in _definition_texts(resource):
+            for sentence in _split_sentences(text, DEFINITION_SENTENCE_WINDOW):
+                if len(sentence) > 30 and topic_lower in sentence.lower():
+                    yield sentence
+
 def extract_definition(topic, resources):
     """Extract definition from resources"""
-    # Search for definition in resources
-    for resource in resources:
-        # Check abstract first for PubMed articles
-        if resource.get('abstract'):
-            sentences = resource['abstract'].split('.')
-            for sentence in sentences[:3]:
-                if topic.lower() in sentence.lower() and len(sentence) > 30:
-                    return sentence.strip() + '.'
-        
-        # Check cached content
-        if resource.get('cached_content'):
-            content = resource['cached_content']
-            if isinstance(content, str):
-                try:
-                    content = json.loads(content)
-                except:
-                    pass
-            
-            # Extract from various content types
-            if isinstance(content, dict):
-                # Check abstract
-                if content.get('abstract'):
-                    sentences = content['abstract'].split('.')
-                    for sentence in sentences[:3]:
-                        if topic.lower() in sentence.lower() and len(sentence) > 30:
-                            return sentence.strip() + '.'
-                
-                # Check sections (for book chapters)
-                if content.get('sections'):
-                    for section in content['sections']:
-                        if section.get('content'):
-                            sentences = section['content'].split('.')
-                            for sentence in sentences[:3]:
-                                if topic.lower() in sentence.lower() and len(sentence) > 30:
-                                    return sentence.strip() + '.'
-    
-    # Fallback if no good definition found
-    return f"The topic {topic} requires further exploration to provide a comprehensive definition."
+    # Stop at the first match; later resources are never parsed
+    return next(
+        _candidate_definitions(topic, resources),
+        f"The topic {topic} requires further exploration to provide a comprehensive definition."
+    )
 
 def extract_key_concepts(topic, resources):
     """Extract key concepts from resources"""
     concepts = []
+    topic_lower = topic.lower()
     
     # Check MeSH terms for relevant concepts
     for resource in resources:
         if resource.get('cached_content'):
-            content = resource['cached_content']
-            if isinstance(content, str):
-                try:
-                    content = json.loads(content)
-                except:
-                    pass
+            content = _deserialized(resource)
             
             if isinstance(content, dict) and content.get('mesh_terms'):
                 # Find relevant MeSH terms
                 for term in content['mesh_terms']:
-                    if topic.lower() in term.lower():
+                    if topic_lower in term.lower():
                         concepts.append(term)
     
     # Check sections and headings in bookshelf content
     for resource in resources:
         if resource.get('source_type') == 'bookshelf' and resource.get('cached_content'):
-            content = resource['cached_content']
-            if isinstance(content, str):
-                try:
-                    content = json.loads(content)
-                except:
-                    pass
+            content = _deserialized(resource)
             
             if isinstance(content, dict) and content.get('chapters'):
                 for chapter in content['chapters']:
-                    if topic.lower() in chapter.get('title', '').lower():
+                    if topic_lower in chapter.get('title', '').lower():
                         concepts.append(chapter['title'])
     
     # Add generic concepts if we don't have enough
@@ -332,8 +570,10 @@ def extract_key_concepts(topic, resources):
         ]
         
         # Add generic concepts until we have at least 3
+        seen = set(concepts)
         for concept in generic_concepts:
-            if concept not in concepts:
+            if concept not in seen:
+                seen.add(concept)
                 concepts.append(concept)
                 if len(concepts) >= 5:
                     break
@@ -341,17 +581,24 @@ def extract_key_concepts(topic, resources):
     return concepts[:5]  # Return up to 5 key concepts
 
 @content_server.tool()
-def suggest_learning_resources(topic: str, student_level: str) -> list:
+async def suggest_learning_resources(topic: str, student_level: str, local_only: bool = False) -> list:
     """
     Suggest learning resources based on topic and student level.
     
     Args:
         topic: Medical topic of interest
         student_level: Student's academic level (first_year, second_year, clinical_years)
+        local_only: Only suggest resources already in the local database
         
     Returns:
         List of recommended resources with rationale
     """
+    key = (_topic_key(topic), student_level, local_only)
+    recommendations, stale = _suggestion_cache.get(key)
+    if recommendations is not None and not stale:
+        # Callers get their own copy so they can't alter the cached list
+        return copy.deepcopy(recommendations)
+    
     # Map student level to difficulty
     difficulty_map = {
         "first_year": "basic",
@@ -362,7 +609,8 @@ def suggest_learning_resources(topic: str, student_level: str) -> list:
     difficulty = difficulty_map.get(student_level, "intermediate")
     
     # Search for resources with appropriate difficulty
-    resources = search_medical_content(topic, difficulty=difficulty, max_results=5)
+    resources = await search_medical_content(topic, difficulty=difficulty, max_results=5,
+                                             local_only=local_only)
     
     # Add recommendation rationale
     recommendations = []
@@ -375,7 +623,8 @@ def suggest_learning_resources(topic: str, student_level: str) -> list:
         }
         recommendations.append(recommendation)
     
-    return recommendations
+    _suggestion_cache.set(key, recommendations)
+    return copy.deepcopy(recommendations)
 
 def generate_recommendation_rationale(resource, topic, student_level):
     """Generate explanation for resource recommendation"""
@@ -395,6 +644,9 @@ def import_user_document(document_content: str, document_title: str) -> str:
     """
     Import user-provided learning material into the system.
     
+    The title is matched by every search; pass search_content=True to
+    search_medical_content to match the document's text as well.
+    
     Args:
         document_content: Text content of the document
         document_title: Title of the document
@@ -405,10 +657,16 @@ def import_user_document(document_content: str, document_title: str) -> str:
     # Store document in database
     doc_id = database.add_user_document(document_title, document_content)
     
+    # Don't serve a stale cached copy for this ID, and let topic overviews
+    # and suggestions pick up the new document
+    invalidate_resource_cache(doc_id)
+    _overview_cache.clear()
+    _suggestion_cache.clear()
+    
     return doc_id
 
 @content_server.tool()
-def generate_learning_plan(topic: str, student_level: str) -> dict:
+async def generate_learning_plan(topic: str, student_level: str) -> dict:
     """
     Generate a structured learning plan for a medical topic.
     
@@ -420,10 +678,11 @@ def generate_learning_plan(topic: str, student_level: str) -> dict:
         Structured learning plan with objectives and resources
     """
     # Get topic overview
-    overview = get_topic_overview(topic)
+    overview = await get_topic_overview(topic)
     
-    # Get recommended resources
-    resources = suggest_learning_resources(topic, student_level)
+    # Get recommended resources. The overview search has just cached the
+    # external results for this topic, so don't fetch them again.
+    resources = await suggest_learning_resources(topic, student_level, local_only=True)
     
     # Create learning objectives based on level
     if student_level == "first_year":
@@ -483,9 +742,7 @@ def extract_article_key_points(resource_id: str) -> dict:
         # Extract from PubMed article
         key_points = {
             'title': resource.get('title'),
-            'main_findings': extract_main_findings(resource),
-            'methodology': extract_methodology(resource),
-            'clinical_implications': extract_clinical_implications(resource),
+            **extract_abstract_points(resource),
             'key_terms': extract_key_terms(resource)
         }
     elif resource.get('source_type') == 'bookshelf':
@@ -511,83 +768,48 @@ def extract_article_key_points(resource_id: str) -> dict:
     
     return key_points
 
-def extract_main_findings(resource):
-    """Extract main findings from PubMed article"""
-    # Simplified implementation - in a real system, use NLP
-    if resource.get('abstract'):
-        # Look for sentences that might indicate findings
-        findings_indicators = [
-            "we found", "results showed", "demonstrated", "revealed", 
-            "observed", "concluded", "findings"
-        ]
-        
-        findings = []
-        sentences = resource['abstract'].split('.')
-        
-        for sentence in sentences:
-            lower_sent = sentence.lower()
-            for indicator in findings_indicators:
-                if indicator in lower_sent and len(sentence.strip()) > 20:
-                    findings.append(sentence.strip() + '.')
-                    break
-        
-        if findings:
-            return findings[:3]  # Return top 3 findings
-    
-    # Fallback if no findings extracted
-    return ["The article's main findings could not be automatically extracted. Please review the full abstract."]
+# Sections extract_abstract_points pulls out of an abstract: the indicator
+# pattern for each, how many sentences to keep, and the text returned when
+# nothing matches
+_ABSTRACT_SECTIONS = {
+    'main_findings': (
+        _FINDINGS_RE, 3,
+        "The article's main findings could not be automatically extracted. Please review the full abstract."
+    ),
+    'methodology': (
+        _METHOD_RE, 2,
+        "The article's methodology could not be automatically extracted. Please review the full abstract."
+    ),
+    'clinical_implications': (
+        _IMPLICATIONS_RE, 2,
+        "The clinical implications could not be automatically extracted. Please review the full abstract."
+    ),
+}
 
-def extract_methodology(resource):
-    """Extract methodology from PubMed article"""
-    # Simplified implementation - in a real system, use NLP
-    if resource.get('abstract'):
-        # Look for sentences that might describe methodology
-        method_indicators = [
-            "method", "study design", "we conducted", "participants", 
-            "patients", "subjects", "sample", "procedure", "analysis"
-        ]
-        
-        methods = []
-        sentences = resource['abstract'].split('.')
-        
-        for sentence in sentences:
-            lower_sent = sentence.lower()
-            for indicator in method_indicators:
-                if indicator in lower_sent and len(sentence.strip()) > 20:
-                    methods.append(sentence.strip() + '.')
-                    break
-        
-        if methods:
-            return methods[:2]  # Return top 2 methodology sentences
+def extract_abstract_points(resource):
+    """
+    Extract main findings, methodology and clinical implications from a
+    PubMed article in a single pass over its abstract
     
-    # Fallback if no methodology extracted
-    return ["The article's methodology could not be automatically extracted. Please review the full abstract."]
-
-def extract_clinical_implications(resource):
-    """Extract clinical implications from article"""
+    Each sentence is tested against every section's indicators, so a
+    sentence can appear in more than one section.
+    """
     # Simplified implementation - in a real system, use NLP
-    if resource.get('abstract'):
-        # Look for sentences that might indicate clinical implications
-        implication_indicators = [
-            "implications", "clinical", "practice", "treatment", 
-            "management", "care", "patients", "therapy", "intervention"
-        ]
-        
-        implications = []
-        sentences = resource['abstract'].split('.')
-        
-        for sentence in sentences:
-            lower_sent = sentence.lower()
-            for indicator in implication_indicators:
-                if indicator in lower_sent and len(sentence.strip()) > 20:
-                    implications.append(sentence.strip() + '.')
-                    break
+    points = {name: [] for name in _ABSTRACT_SECTIONS}
+    
+    for sentence in _split_sentences(resource.get('abstract') or ''):
+        if len(sentence) <= 20:
+            continue
         
-        if implications:
-            return implications[:2]  # Return top 2 implications
+        for name, (pattern, limit, _) in _ABSTRACT_SECTIONS.items():
+            if len(points[name]) < limit and pattern.search(sentence):
+                points[name].append(sentence)
     
-    # Fallback if no implications extracted
-    return ["The clinical implications could not be automatically extracted. Please review the full abstract."]
+    # Fall back to a note for any section nothing was found for
+    return {
+        name: points[name] or [fallback]
+        for name, (_, _, fallback) in _ABSTRACT_SECTIONS.items()
+    }
 
 def extract_key_terms(resource):
     """Extract key terms from resource"""
@@ -602,27 +824,23 @@ def extract_key_terms(resource):
     if resource.get('title'):
         title_words = resource['title'].split()
         for word in title_words:
-            if len(word) > 5 and word.lower() not in ['about', 'these', 'those', 'their', 'there']:
+            if len(word) > 5 and word.lower() not in _STOPWORDS:
                 terms.append(word)
     
     # Extract from abstract if available
     if resource.get('abstract'):
         # This is a very simplified approach - real implementation would use NLP
-        abstract_words = resource['abstract'].split()
-        word_freq = {}
-        
-        for word in abstract_words:
-            clean_word = ''.join(c for c in word if c.isalnum())
-            if len(clean_word) > 5 and clean_word.lower() not in ['about', 'these', 'those', 'their', 'there']:
-                if clean_word in word_freq:
-                    word_freq[clean_word] += 1
-                else:
-                    word_freq[clean_word] = 1
+        clean_words = (''.join(c for c in word if c.isalnum()) for word in resource['abstract'].split())
+        word_freq = Counter(
+            word for word in clean_words
+            if len(word) > 5 and word.lower() not in _STOPWORDS
+        )
         
         # Get top 5 most frequent words
-        sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        for word, freq in sorted_words[:5]:
-            if word not in terms:
+        seen = set(terms)
+        for word, freq in word_freq.most_common(5):
+            if word not in seen:
+                seen.add(word)
                 terms.append(word)
     
     return terms[:5]  # Return up to 5 terms
@@ -636,9 +854,8 @@ def extract_main_concepts(resource):
         concepts.append(f"Understanding {resource['title']}")
     
     # Extract from chapter sections if available
-    if resource.get('cached_content') and isinstance(resource['cached_content'], dict):
-        content = resource['cached_content']
-        
+    content = _deserialized(resource)
+    if isinstance(content, dict):
         if content.get('sections'):
             for section in content['sections'][:3]:  # Get first 3 sections
                 if section.get('title'):
@@ -653,8 +870,10 @@ def extract_main_concepts(resource):
             "Anatomical Relationships"
         ]
         
+        seen = set(concepts)
         for concept in generic_concepts:
-            if concept not in concepts:
+            if concept not in seen:
+                seen.add(concept)
                 concepts.append(concept)
                 if len(concepts) >= 5:
                     break
@@ -669,9 +888,8 @@ def extract_key_definitions(resource):
     # This is a simplified version
     
     # Check for sections content
-    if resource.get('cached_content') and isinstance(resource['cached_content'], dict):
-        content = resource['cached_content']
-        
+    content = _deserialized(resource)
+    if isinstance(content, dict):
         if content.get('sections'):
             for section in content['sections']:
                 if section.get('content'):
@@ -693,20 +911,17 @@ def extract_clinical_correlations(resource):
     # This is a simplified version
     
     # Check for sections content
-    if resource.get('cached_content') and isinstance(resource['cached_content'], dict):
-        content = resource['cached_content']
-        
+    content = _deserialized(resource)
+    if isinstance(content, dict):
         if content.get('sections'):
             for section in content['sections']:
                 if section.get('title') and 'clinical' in section['title'].lower():
                     correlations.append(section['title'])
                 
                 if section.get('content'):
-                    sentences = section['content'].split('.')
-                    for sentence in sentences:
-                        lower_sent = sentence.lower()
-                        if ('clinic' in lower_sent or 'patient' in lower_sent or 'disease' in lower_sent) and len(sentence) > 30:
-                            correlations.append(sentence.strip() + '.')
+                    for sentence in _split_sentences(section['content']):
+                        if _CLINICAL_CORRELATION_RE.search(sentence) and len(sentence) > 30:
+                            correlations.append(sentence)
     
     return correlations[:3]  # Return up to 3 clinical correlations
 
@@ -715,9 +930,8 @@ def extract_main_points_from_document(resource):
     main_points = []
     
     # Get content from the resource
-    if resource.get('cached_content') and isinstance(resource['cached_content'], dict):
-        content = resource['cached_content']
-        
+    content = _deserialized(resource)
+    if isinstance(content, dict):
         if content.get('content'):
             # Split into paragraphs
             paragraphs = content['content'].split('\n\n')
@@ -727,28 +941,20 @@ def extract_main_points_from_document(resource):
                 main_points.append(paragraphs[0])
             
             # Look for key sentences in other paragraphs
-            indicators = [
-                "important", "significant", "key", "essential", "crucial",
-                "demonstrated", "found", "shows", "reveals", "concludes"
-            ]
-            
             for paragraph in paragraphs[1:]:
-                sentences = paragraph.split('.')
-                for sentence in sentences:
-                    lower_sent = sentence.lower()
-                    for indicator in indicators:
-                        if indicator in lower_sent and len(sentence) > 30:
-                            main_points.append(sentence.strip() + '.')
-                            break
+                for sentence in _split_sentences(paragraph):
+                    if _MAIN_POINTS_RE.search(sentence) and len(sentence) > 30:
+                        main_points.append(sentence)
     
     # If we didn't find enough points, add the first few sentences
-    if len(main_points) < 3 and resource.get('cached_content'):
-        content = resource['cached_content']
+    if len(main_points) < 3:
+        content = _deserialized(resource)
         if isinstance(content, dict) and content.get('content'):
-            sentences = content['content'].split('.')
-            for sentence in sentences[:5]:
-                if len(sentence) > 30 and sentence.strip() + '.' not in main_points:
-                    main_points.append(sentence.strip() + '.')
+            seen = set(main_points)
+            for sentence in _split_sentences(content['content'], 5):
+                if len(sentence) > 30 and sentence not in seen:
+                    seen.add(sentence)
+                    main_points.append(sentence)
                     if len(main_points) >= 5:
                         break
     
@@ -770,12 +976,12 @@ def initialize_server():
             
         # Log server information
         logger.info("MedAdapt Content Server initialized successfully")
-        logger.info(f"Python version: {sys.version}")
-        logger.info(f"Server running from: {os.path.dirname(os.path.abspath(__file__))}")
+        logger.info("Python version: %s", sys.version)
+        logger.info("Server running from: %s", os.path.dirname(os.path.abspath(__file__)))
         
         return True
     except Exception as e:
-        logger.error(f"Server initialization failed: {str(e)}")
+        logger.error("Server initialization failed: %s", e)
         logger.error(traceback.format_exc())
         return False
 
@@ -792,6 +998,6 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
     except Exception as e:
-        logger.error(f"Server error: {str(e)}")
+        logger.error("Server error: %s", e)
         logger.error(traceback.format_exc())
         sys.exit(1) 
\ No newline at end of file
@@ -1,192 +1,556 @@
+import atexit
+import logging
 import sqlite3
 import os
-import json
-from datetime import datetime
+import threading
+import zlib
+from collections import Counter
+import orjson
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+
+logger = logging.getLogger("medadapt_database")
+
+# Per-connection settings. synchronous=NORMAL is still crash-safe in WAL
+# mode but avoids an fsync on every commit. mmap_size lets reads come
+# straight from a memory mapping of up to 256 MB (SQLite caps it at the file
+# size) instead of being copied into the page cache, and cache_size keeps
+# 64 MB of hot pages resident for everything else.
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+# Prepared statements kept per connection. sqlite3 reuses a compiled
+# statement whenever the same SQL text runs again, and every query here is
+# a constant or one of a few dozen search_resources shapes, so each thread
+# compiles each statement once. The default of 128 leaves little headroom.
+STATEMENT_CACHE_SIZE = 256
+
+DB_PATH = 'medadapt_content.db'
+
+# One connection per thread, opened on first use and reused by every helper
+_local = threading.local()
 
 def get_db_connection():
-    """Create connection to SQLite database with row factory"""
-    conn = sqlite3.connect('medadapt_content.db')
+    """
+    Return this thread's SQLite connection, creating it on first use
+    
+    The connection is shared by all helpers in the thread, so callers must
+    not close it. Writes should run inside a `with conn:` block.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _connect(DB_PATH)
+        _local.conn = conn
+    return conn
+
+def _connect(path):
+    """Open and configure a connection to the database at path"""
+    conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+@contextmanager
+def temporary_database(path=':memory:'):
+    """
+    Route this thread's database calls to a separate database inside the block
+    
+    Meant for tests. With the default ':memory:' path nothing is written to
+    disk and the database is discarded when the block exits. Other threads
+    keep using their usual connection. The caller must still run
+    initialize_database() inside the block.
+    """
+    saved = getattr(_local, 'conn', None)
+    saved_temporary = getattr(_local, 'temporary', False)
+    _local.conn = _connect(path)
+    _local.temporary = True
+    _related_topics.cache_clear()
+    try:
+        yield _local.conn
+    finally:
+        _local.conn.close()
+        _local.conn = saved
+        _local.temporary = saved_temporary
+        _related_topics.cache_clear()
+
+def close_db_connection():
+    """Close this thread's connection; the next helper call reopens it"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+# cached_content is stored as zlib-compressed JSON. Rows written before
+# compression was added hold plain JSON, which never starts with the zlib
+# header byte, so both forms can be read. This is the only copy of the
+# content kept in resources; resources_fts holds tokens, not text.
+CONTENT_COMPRESSION_LEVEL = 6
+_ZLIB_HEADER = b'\x78'
+
+def _dump_content(content):
+    """Serialize cached_content for storage"""
+    return zlib.compress(orjson.dumps(content), CONTENT_COMPRESSION_LEVEL)
+
+def _content_json(blob):
+    """Return the JSON bytes of a stored cached_content value"""
+    if isinstance(blob, str):
+        return blob.encode('utf-8')
+    if blob[:1] == _ZLIB_HEADER:
+        return zlib.decompress(blob)
+    return blob
+
+def _load_content(blob):
+    """Deserialize a stored cached_content value"""
+    return orjson.loads(_content_json(blob))
+
+def _content_text(content):
+    """Return the prose in a cached_content value: its abstract, body and sections"""
+    if not isinstance(content, dict):
+        return None
+    
+    parts = [content.get('abstract'), content.get('content')]
+    for section in content.get('sections') or ():
+        if isinstance(section, dict):
+            parts.extend((section.get('title'), section.get('content')))
+    return '\n\n'.join(part for part in parts if isinstance(part, str) and part) or None
+
+def _stored_content_text(blob):
+    """_content_text of a stored cached_content value"""
+    if blob is None:
+        return None
+    try:
+        return _content_text(_load_content(blob))
+    except (zlib.error, orjson.JSONDecodeError):
+        return None
+
+# Tables and indexes created by initialize_database. The script runs in
+# one explicit transaction so a cold start pays for a single commit.
+SCHEMA_SQL = '''
+BEGIN;
+
+-- Resources table for storing content metadata and cached content
+CREATE TABLE IF NOT EXISTS resources (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    source_type TEXT NOT NULL,
+    specialty TEXT,
+    difficulty TEXT,
+    content_type TEXT,
+    source_id TEXT,
+    abstract TEXT,
+    cached_content BLOB,
+    last_updated TEXT,
+    access_count INTEGER DEFAULT 0
+);
+
+-- Topic mappings for relationships between medical topics
+CREATE TABLE IF NOT EXISTS topic_mappings (
+    topic TEXT NOT NULL,
+    parent_topic TEXT,
+    specialty TEXT,
+    description TEXT,
+    PRIMARY KEY (topic, parent_topic)
+);
+
+-- User documents table for tracking user-provided content
+CREATE TABLE IF NOT EXISTS user_documents (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    upload_date TEXT NOT NULL
+);
+
+-- HTTP cache for raw responses from external APIs, keyed by URL hash
+CREATE TABLE IF NOT EXISTS http_cache (
+    url_hash TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    fetched_at TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT
+);
+
+-- Indexes for the search_resources filters and its ORDER BY, and for
+-- the parent_topic lookups in get_related_topics. topic_mappings(topic)
+-- is already covered by the primary key.
+CREATE INDEX IF NOT EXISTS idx_resources_filter
+ON resources (specialty, difficulty, content_type, access_count DESC);
+CREATE INDEX IF NOT EXISTS idx_topic_parent
+ON topic_mappings (parent_topic);
+
+COMMIT;
+'''
+
 def initialize_database():
     """Initialize the database schema if it doesn't exist"""
-    conn = sqlite3.connect('medadapt_content.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
-    # Resources table for storing content metadata and cached content
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS resources (
-        id TEXT PRIMARY KEY,
-        title TEXT NOT NULL,
-        source_type TEXT NOT NULL,
-        specialty TEXT,
-        difficulty TEXT,
-        content_type TEXT,
-        source_id TEXT,
-        cached_content TEXT,
-        last_updated TEXT,
-        access_count INTEGER DEFAULT 0
-    )
-    ''')
-    
-    # Topic mappings for relationships between medical topics
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS topic_mappings (
-        topic TEXT NOT NULL,
-        parent_topic TEXT,
-        specialty TEXT,
-        description TEXT,
-        PRIMARY KEY (topic, parent_topic)
-    )
-    ''')
-    
-    # User documents table for tracking user-provided content
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS user_documents (
-        id TEXT PRIMARY KEY,
-        title TEXT NOT NULL,
-        content TEXT NOT NULL,
-        upload_date TEXT NOT NULL
-    )
-    ''')
+    # WAL mode is stored in the database file, so setting it once here
+    # lets readers and a writer work concurrently on every later connection
+    c.execute("PRAGMA journal_mode=WAL").fetchall()
+    
+    # Create every table and index in a single transaction
+    c.executescript(SCHEMA_SQL)
+    
+    # Databases created before abstracts were stored lack the column
+    columns = [row[1] for row in c.execute("PRAGMA table_info(resources)")]
+    if 'abstract' not in columns:
+        c.execute("ALTER TABLE resources ADD COLUMN abstract TEXT")
+    
+    # Databases created before cached responses were revalidated lack
+    # the validator columns
+    columns = [row[1] for row in c.execute("PRAGMA table_info(http_cache)")]
+    for column in ('etag', 'last_modified'):
+        if column not in columns:
+            c.execute(f"ALTER TABLE http_cache ADD COLUMN {column} TEXT")
+    
+    # Full-text index over resource titles, abstracts and cached content
+    _create_fts_index(c)
+    
+    # A plain-text copy of cached_content was briefly stored for the old
+    # index layout; its triggers are gone now, so the column can go too
+    columns = [row[1] for row in c.execute("PRAGMA table_info(resources)")]
+    if 'content_text' in columns:
+        c.execute("ALTER TABLE resources DROP COLUMN content_text")
     
     conn.commit()
-    conn.close()
-    print("Database initialized successfully.")
+    logger.info("Database initialized successfully.")
+
+def _create_fts_index(c):
+    """Create the resources_fts index and its sync triggers if FTS5 is available"""
+    c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'resources_fts'")
+    row = c.fetchone()
+    if row and "content=''" in row[0] and 'body' in row[0]:
+        return
+    if row:
+        # Drop an index from an older layout (external content read from
+        # resources or the resources_text view, kept in step by triggers)
+        c.execute("DROP TRIGGER IF EXISTS resources_fts_insert")
+        c.execute("DROP TRIGGER IF EXISTS resources_fts_delete")
+        c.execute("DROP TRIGGER IF EXISTS resources_fts_update")
+        c.execute("DROP TABLE resources_fts")
+        c.execute("DROP VIEW IF EXISTS resources_text")
+    
+    # The index is contentless: it keeps only the token index, not a second
+    # copy of the text. body is the prose from cached_content (see
+    # _content_text), which is stored compressed, so _write_resources keeps
+    # the index in step from Python rather than with triggers.
+    try:
+        c.execute('''
+        CREATE VIRTUAL TABLE resources_fts USING fts5(
+            title, abstract, body,
+            content='',
+            tokenize='porter unicode61'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        logger.warning("Full-text search unavailable, falling back to LIKE: %s", e)
+        return
+    
+    # Index rows that were stored before the FTS table existed
+    c.execute("SELECT rowid, title, abstract, cached_content FROM resources")
+    while True:
+        rows = c.fetchmany(RESOURCE_BATCH_SIZE)
+        if not rows:
+            break
+        c.connection.executemany(
+            "INSERT INTO resources_fts (rowid, title, abstract, body) VALUES (?, ?, ?, ?)",
+            [(rowid, title, abstract, _stored_content_text(blob)) for rowid, title, abstract, blob in rows]
+        )
+
+# Set once resources_fts has been seen so later searches skip the lookup
+_fts_enabled = False
+
+def _has_fts_index(c):
+    """Check whether the resources_fts index exists"""
+    global _fts_enabled
+    if not _fts_enabled:
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'resources_fts'")
+        _fts_enabled = c.fetchone() is not None
+    return _fts_enabled
+
+def _fts_query(query, search_content):
+    """
+    Build an FTS5 MATCH expression from free text
+    
+    Every term becomes a quoted prefix query, so FTS syntax in user input is
+    treated literally. Returns None if the text has no searchable terms.
+    """
+    terms = [term for term in query.split() if any(ch.isalnum() for ch in term)]
+    if not terms:
+        return None
+    
+    phrases = ' '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+    columns = '{title abstract body}' if search_content else '{title abstract}'
+    return f"{columns} : ({phrases})"
+
+# Insert a resource, or update it in place if the id already exists.
+# access_count is deliberately left untouched on update.
+UPSERT_RESOURCE_SQL = '''
+INSERT INTO resources 
+(id, title, source_type, specialty, difficulty, content_type, 
+ source_id, abstract, cached_content, last_updated, access_count)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+ON CONFLICT(id) DO UPDATE SET
+    title = excluded.title,
+    source_type = excluded.source_type,
+    specialty = excluded.specialty,
+    difficulty = excluded.difficulty,
+    content_type = excluded.content_type,
+    source_id = excluded.source_id,
+    abstract = excluded.abstract,
+    cached_content = excluded.cached_content,
+    last_updated = excluded.last_updated
+'''
+
+# Number of rows handed to each executemany call in add_resources
+RESOURCE_BATCH_SIZE = 500
+
+def _resource_row(resource_data):
+    """Convert a resource dict into a parameter tuple for UPSERT_RESOURCE_SQL"""
+    return (
+        resource_data['id'],
+        resource_data['title'],
+        resource_data['source_type'],
+        resource_data.get('specialty'),
+        resource_data.get('difficulty'),
+        resource_data.get('content_type'),
+        resource_data.get('source_id'),
+        resource_data.get('abstract'),
+        _dump_content(resource_data.get('cached_content', {})),
+        datetime.now().isoformat()
+    )
 
 def add_resource(resource_data):
     """Add or update a resource in the database"""
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Check if resource already exists
-    c.execute("SELECT id FROM resources WHERE id = ?", (resource_data['id'],))
-    existing = c.fetchone()
+    add_resources([resource_data])
+
+def add_resources(resources):
+    """Add or update many resources in a single transaction"""
+    resources = iter(resources)
     
-    if existing:
-        # Update existing resource
-        c.execute('''
-        UPDATE resources 
-        SET title = ?, source_type = ?, specialty = ?, 
-            difficulty = ?, content_type = ?, source_id = ?,
-            cached_content = ?, last_updated = ?
-        WHERE id = ?
-        ''', (
-            resource_data['title'],
-            resource_data['source_type'],
-            resource_data.get('specialty'),
-            resource_data.get('difficulty'),
-            resource_data.get('content_type'),
-            resource_data.get('source_id'),
-            json.dumps(resource_data.get('cached_content', {})),
-            datetime.now().isoformat(),
-            resource_data['id']
-        ))
-    else:
-        # Insert new resource
-        c.execute('''
-        INSERT INTO resources 
-        (id, title, source_type, specialty, difficulty, content_type, 
-         source_id, cached_content, last_updated, access_count)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
-        ''', (
-            resource_data['id'],
-            resource_data['title'],
-            resource_data['source_type'],
-            resource_data.get('specialty'),
-            resource_data.get('difficulty'),
-            resource_data.get('content_type'),
-            resource_data.get('source_id'),
-            json.dumps(resource_data.get('cached_content', {})),
-            datetime.now().isoformat()
-        ))
+    conn = get_db_connection()
+    with conn:
+        while True:
+            batch = list(islice(resources, RESOURCE_BATCH_SIZE))
+            if not batch:
+                break
+            _write_resources(conn, batch)
+
+def _write_resources(conn, batch):
+    """Upsert a batch of resources and update resources_fts to match"""
+    if not _has_fts_index(conn.cursor()):
+        conn.executemany(UPSERT_RESOURCE_SQL, [_resource_row(resource_data) for resource_data in batch])
+        return
+    
+    # A contentless index can only drop a row given the values it indexed,
+    # so rows being replaced are removed with their stored values first
+    ids = list({resource_data['id']: None for resource_data in batch})
+    placeholders = ', '.join('?' * len(ids))
+    old_rows = conn.execute(
+        f"SELECT rowid, title, abstract, cached_content FROM resources WHERE id IN ({placeholders})", ids
+    ).fetchall()
+    conn.executemany(
+        "INSERT INTO resources_fts (resources_fts, rowid, title, abstract, body) VALUES ('delete', ?, ?, ?, ?)",
+        [(rowid, title, abstract, _stored_content_text(blob)) for rowid, title, abstract, blob in old_rows]
+    )
     
-    conn.commit()
-    conn.close()
+    conn.executemany(UPSERT_RESOURCE_SQL, [_resource_row(resource_data) for resource_data in batch])
+    
+    # The last entry wins when an id appears more than once in the batch
+    latest = {resource_data['id']: resource_data for resource_data in batch}
+    rowids = conn.execute(f"SELECT id, rowid FROM resources WHERE id IN ({placeholders})", ids).fetchall()
+    conn.executemany(
+        "INSERT INTO resources_fts (rowid, title, abstract, body) VALUES (?, ?, ?, ?)",
+        [
+            (rowid, latest[resource_id]['title'], latest[resource_id].get('abstract'),
+             _content_text(latest[resource_id].get('cached_content', {})))
+            for resource_id, rowid in rowids
+        ]
+    )
+
+# How often pending access_count increments are written back, in seconds
+ACCESS_FLUSH_INTERVAL = 5.0
+
+# Resource reads are counted in memory and flushed to DB_PATH in one
+# transaction so get_resource never waits on a write
+_access_counts = Counter()
+_access_lock = threading.Lock()
+_flush_timer = None
+
+def _record_access(resource_id):
+    """Count a resource read and schedule a flush if none is pending"""
+    global _flush_timer
+    if getattr(_local, 'temporary', False):
+        # The batch is flushed to DB_PATH from the timer thread, so reads
+        # from a temporary database are counted in it directly instead
+        conn = get_db_connection()
+        with conn:
+            conn.execute(
+                "UPDATE resources SET access_count = access_count + 1 WHERE id = ?",
+                (resource_id,)
+            )
+        return
+    
+    with _access_lock:
+        _access_counts[resource_id] += 1
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(ACCESS_FLUSH_INTERVAL, _flush_in_background)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+def flush_access_counts():
+    """Write pending access_count increments to the database"""
+    global _flush_timer
+    if getattr(_local, 'temporary', False):
+        # This thread's connection is not DB_PATH; leave the counts for the timer
+        return
+    
+    with _access_lock:
+        pending = [(count, resource_id) for resource_id, count in _access_counts.items()]
+        _access_counts.clear()
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+    
+    if not pending:
+        return
+    
+    try:
+        conn = get_db_connection()
+        with conn:
+            conn.executemany(
+                "UPDATE resources SET access_count = access_count + ? WHERE id = ?",
+                pending
+            )
+    except sqlite3.Error as e:
+        logger.error("Error updating access counts: %s", e)
+
+def _flush_in_background():
+    """Timer callback; the timer thread's connection is closed afterwards"""
+    try:
+        flush_access_counts()
+    finally:
+        close_db_connection()
+
+# Don't lose counts recorded since the last flush
+atexit.register(flush_access_counts)
+
+# Columns returned for a resource by get_resource and search_resources
+_RESOURCE_COLUMNS = ', '.join(f"r.{column}" for column in (
+    'id', 'title', 'source_type', 'specialty', 'difficulty', 'content_type',
+    'source_id', 'abstract', 'cached_content', 'last_updated', 'access_count'
+))
 
 def get_resource(resource_id):
     """Retrieve a resource from the database"""
     conn = get_db_connection()
     c = conn.cursor()
     
-    c.execute("SELECT * FROM resources WHERE id = ?", (resource_id,))
+    c.execute(f"SELECT {_RESOURCE_COLUMNS} FROM resources r WHERE r.id = ?", (resource_id,))
     resource = c.fetchone()
     
     if resource:
-        # Update access count
-        c.execute("UPDATE resources SET access_count = access_count + 1 WHERE id = ?", 
-                 (resource_id,))
-        conn.commit()
+        # Count the access; the increment is written later in a batch
+        _record_access(resource_id)
         
         # Convert to dict
         result = dict(resource)
         
-        # Parse cached_content if it's a JSON string
+        # Parse cached_content if it's serialized JSON
         if result.get('cached_content'):
             try:
-                result['cached_content'] = json.loads(result['cached_content'])
+                result['cached_content'] = _load_content(result['cached_content'])
             except:
                 pass
     else:
         result = None
     
-    conn.close()
     return result
 
-def search_resources(query=None, specialty=None, difficulty=None, content_type=None, limit=10):
-    """Search resources based on criteria"""
+def search_resources(query=None, specialty=None, difficulty=None, content_type=None, limit=10,
+                     search_content=False):
+    """
+    Search resources based on criteria
+    
+    The query is matched against titles and abstracts, plus cached content
+    when search_content is set. Matching uses the resources_fts full-text
+    index when it exists, ranking results by relevance, and falls back to
+    LIKE for punctuation-only queries or when FTS5 is unavailable. Without
+    the index, cached content is compressed, so it is matched in Python.
+    """
     conn = get_db_connection()
     c = conn.cursor()
     
-    sql = "SELECT * FROM resources WHERE 1=1"
     params = []
+    order_by = "r.access_count DESC"
+    content_match = None
     
-    if query:
-        sql += " AND (title LIKE ? OR cached_content LIKE ?)"
-        params.extend([f"%{query}%", f"%{query}%"])
+    fts_query = _fts_query(query, search_content) if query and _has_fts_index(c) else None
+    
+    if fts_query:
+        sql = (f"SELECT {_RESOURCE_COLUMNS} FROM resources_fts"
+               " JOIN resources r ON r.rowid = resources_fts.rowid WHERE resources_fts MATCH ?")
+        params.append(fts_query)
+        order_by = "resources_fts.rank, " + order_by
+    else:
+        sql = f"SELECT {_RESOURCE_COLUMNS} FROM resources r WHERE 1=1"
+        if query and search_content:
+            content_match = query.lower()
+        elif query:
+            sql += " AND (r.title LIKE ? OR r.abstract LIKE ?)"
+            params.extend([f"%{query}%"] * 2)
     
     if specialty:
-        sql += " AND specialty = ?"
+        sql += " AND r.specialty = ?"
         params.append(specialty)
     
     if difficulty:
-        sql += " AND difficulty = ?"
+        sql += " AND r.difficulty = ?"
         params.append(difficulty)
     
     if content_type:
-        sql += " AND content_type = ?"
+        sql += " AND r.content_type = ?"
         params.append(content_type)
     
-    sql += " ORDER BY access_count DESC LIMIT ?"
-    params.append(limit)
+    sql += f" ORDER BY {order_by}"
+    if content_match is None:
+        sql += " LIMIT ?"
+        params.append(limit)
     
     c.execute(sql, params)
-    resources = [dict(row) for row in c.fetchall()]
-    
-    # Parse cached_content if it's a JSON string
+    if content_match is None:
+        resources = [dict(row) for row in c.fetchall()]
+    else:
+        resources = []
+        for row in c:
+            texts = (row['title'], row['abstract'], _stored_content_text(row['cached_content']))
+            if any(text and content_match in text.lower() for text in texts):
+                resources.append(dict(row))
+                if len(resources) >= limit:
+                    break
+    
+    # Parse cached_content if it's serialized JSON
     for resource in resources:
         if resource.get('cached_content'):
             try:
-                resource['cached_content'] = json.loads(resource['cached_content'])
+                resource['cached_content'] = _load_content(resource['cached_content'])
             except:
                 pass
     
-    conn.close()
     return resources
 
 def add_user_document(title, content):
     """Add user-provided document to the database"""
     doc_id = f"user-doc-{datetime.now().strftime('%Y%m%d%H%M%S')}"
     
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    c.execute('''
-    INSERT INTO user_documents (id, title, content, upload_date)
-    VALUES (?, ?, ?, ?)
-    ''', (doc_id, title, content, datetime.now().isoformat()))
-    
     # Also add to resources table for unified search
     resource_data = {
         'id': doc_id,
@@ -197,10 +561,14 @@ def add_user_document(title, content):
         'last_updated': datetime.now().isoformat()
     }
     
-    add_resource(resource_data)
-    
-    conn.commit()
-    conn.close()
+    # Write both rows in one transaction
+    conn = get_db_connection()
+    with conn:
+        conn.execute('''
+        INSERT INTO user_documents (id, title, content, upload_date)
+        VALUES (?, ?, ?, ?)
+        ''', (doc_id, title, content, datetime.now().isoformat()))
+        _write_resources(conn, [resource_data])
     
     return doc_id
 
@@ -212,58 +580,116 @@ def get_user_document(doc_id):
     c.execute("SELECT * FROM user_documents WHERE id = ?", (doc_id,))
     document = c.fetchone()
     
-    conn.close()
-    
     return dict(document) if document else None
 
 def add_topic_mapping(topic, parent_topic, specialty=None, description=None):
     """Add topic mapping to the database"""
+    add_topic_mappings([(topic, parent_topic, specialty, description)])
+
+def add_topic_mappings(mappings):
+    """
+    Add many topic mappings in a single transaction
+    
+    Each mapping is a (topic, parent_topic, specialty, description) tuple.
+    """
     conn = get_db_connection()
-    c = conn.cursor()
     
-    c.execute('''
-    INSERT OR REPLACE INTO topic_mappings (topic, parent_topic, specialty, description)
-    VALUES (?, ?, ?, ?)
-    ''', (topic, parent_topic, specialty, description))
+    with conn:
+        conn.executemany('''
+        INSERT OR REPLACE INTO topic_mappings (topic, parent_topic, specialty, description)
+        VALUES (?, ?, ?, ?)
+        ''', mappings)
     
-    conn.commit()
-    conn.close()
+    # Mappings changed, so memoized related-topic lookups are stale
+    _related_topics.cache_clear()
+
+# Parents, then children, then siblings of a topic. Duplicates and the
+# topic itself are removed in SQL, keeping each topic's earliest position,
+# so only `limit` rows are ever returned.
+RELATED_TOPICS_SQL = '''
+WITH related (name, branch, position) AS (
+    SELECT parent_topic, 0, rowid FROM topic_mappings
+    WHERE topic = ? AND parent_topic != ''
+    UNION ALL
+    SELECT topic, 1, rowid FROM topic_mappings
+    WHERE parent_topic = ?
+    UNION ALL
+    SELECT tm2.topic, 2, tm2.rowid
+    FROM topic_mappings tm1 
+    JOIN topic_mappings tm2 ON tm1.parent_topic = tm2.parent_topic 
+    WHERE tm1.topic = ?
+)
+SELECT name FROM related
+WHERE name IS NOT NULL AND name <> ?
+GROUP BY name
+ORDER BY MIN(branch), MIN(position)
+LIMIT ?
+'''
+
+@lru_cache(maxsize=1024)
+def _related_topics(topic, limit):
+    """Memoized lookup behind get_related_topics; cleared by add_topic_mapping"""
+    conn = get_db_connection()
+    
+    return tuple(row[0] for row in conn.execute(RELATED_TOPICS_SQL, (topic, topic, topic, topic, limit)))
 
 def get_related_topics(topic, limit=5):
     """Get related topics based on mappings"""
+    return list(_related_topics(topic, limit))
+
+def get_cached_response(url_hash, max_age):
+    """
+    Return a cached response body if it was fetched within max_age seconds
+    
+    A max_age of None accepts a cached body of any age.
+    """
     conn = get_db_connection()
     c = conn.cursor()
     
-    # Get parent topics
-    c.execute("SELECT parent_topic FROM topic_mappings WHERE topic = ?", (topic,))
-    parents = [row['parent_topic'] for row in c.fetchall() if row['parent_topic']]
+    if max_age is None:
+        c.execute("SELECT body FROM http_cache WHERE url_hash = ?", (url_hash,))
+    else:
+        cutoff = (datetime.now() - timedelta(seconds=max_age)).isoformat()
+        c.execute("SELECT body FROM http_cache WHERE url_hash = ? AND fetched_at >= ?",
+                 (url_hash, cutoff))
+    row = c.fetchone()
     
-    # Get child topics
-    c.execute("SELECT topic FROM topic_mappings WHERE parent_topic = ?", (topic,))
-    children = [row['topic'] for row in c.fetchall() if row['topic'] != topic]
+    return row['body'] if row else None
+
+def get_cached_validators(url_hash):
+    """
+    Return the body, etag and last_modified of a cached response of any age
     
-    # Get sibling topics (same parent)
-    sibling_query = '''
-    SELECT tm2.topic 
-    FROM topic_mappings tm1 
-    JOIN topic_mappings tm2 ON tm1.parent_topic = tm2.parent_topic 
-    WHERE tm1.topic = ? AND tm2.topic != ?
-    LIMIT ?
-    '''
-    c.execute(sibling_query, (topic, topic, limit))
-    siblings = [row['topic'] for row in c.fetchall()]
+    Used to revalidate an expired response with a conditional request.
+    Returns None if nothing is cached for url_hash.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
     
-    conn.close()
+    c.execute("SELECT body, etag, last_modified FROM http_cache WHERE url_hash = ?", (url_hash,))
+    row = c.fetchone()
     
-    # Combine and limit results
-    related = []
-    related.extend(parents)
-    related.extend(children)
-    related.extend(siblings)
+    return dict(row) if row else None
+
+def cache_response(url_hash, body, etag=None, last_modified=None):
+    """Store a response body and its validators in the HTTP cache"""
+    conn = get_db_connection()
+    
+    with conn:
+        conn.execute('''
+        INSERT OR REPLACE INTO http_cache (url_hash, body, fetched_at, etag, last_modified)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (url_hash, body, datetime.now().isoformat(), etag, last_modified))
+
+def refresh_cached_response(url_hash):
+    """Mark a cached response as fresh after the server confirmed it unchanged"""
+    conn = get_db_connection()
     
-    # Remove duplicates and limit
-    return list(dict.fromkeys(related))[:limit]
+    with conn:
+        conn.execute("UPDATE http_cache SET fetched_at = ? WHERE url_hash = ?",
+                     (datetime.now().isoformat(), url_hash))
 
 if __name__ == "__main__":
     # Initialize database when script is run directly
+    logging.basicConfig(level=logging.INFO)
     initialize_database() 
\ No newline at end of file
@@ -0,0 +1,363 @@
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from urllib.parse import urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
+import orjson
+from dotenv import load_dotenv
+import database
+
+logger = logging.getLogger("medadapt_ncbi")
+
+# Load environment variables for API key
+load_dotenv()
+API_KEY = os.getenv('NCBI_API_KEY', '')
+# Contact address NCBI can use to reach us about our traffic
+CONTACT_EMAIL = os.getenv('NCBI_EMAIL', '')
+TOOL_NAME = 'medadapt-content-server'
+
+EUTILS_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+# NCBI asks every E-utilities client to identify itself with tool and email
+_COMMON_PARAMS = {'tool': TOOL_NAME}
+if CONTACT_EMAIL:
+    _COMMON_PARAMS['email'] = CONTACT_EMAIL
+if API_KEY:
+    _COMMON_PARAMS['api_key'] = API_KEY
+
+# NCBI allows 10 requests/second with an API key and 3 without
+REQUESTS_PER_SECOND = 10 if API_KEY else 3
+MAX_CONCURRENT_REQUESTS = REQUESTS_PER_SECOND
+
+# (connect, read) timeouts in seconds applied to every NCBI request
+REQUEST_TIMEOUT = (3.05, 27)
+
+# Transient failures (connection errors, rate limiting and 5xx responses)
+# are retried up to MAX_RETRIES times with exponential backoff, honouring
+# any Retry-After header NCBI sends
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# How long raw NCBI responses are served from the HTTP cache (one week)
+HTTP_CACHE_TTL = 7 * 24 * 60 * 60
+
+# How long search results are memoized in process by memoize_search. This
+# is kept short so repeated searches skip the HTTP cache and XML parsing
+# while still picking up NCBI changes through the HTTP cache's expiry
+# and revalidation.
+SEARCH_CACHE_TTL = 10 * 60
+
+# With MEDADAPT_OFFLINE set, responses come only from the HTTP cache,
+# whatever their age, and NCBI is never contacted. Test runs use this to
+# replay earlier responses quickly and deterministically.
+OFFLINE = bool(os.getenv('MEDADAPT_OFFLINE'))
+
+class OfflineCacheMiss(LookupError):
+    """Raised in offline mode when a response isn't in the HTTP cache"""
+
+class _TokenBucket:
+    """
+    Thread-safe token bucket that spaces requests to a fixed rate
+
+    Callers reserve a token and sleep outside the lock until it is due, so
+    concurrent callers queue up in order instead of all retrying at once.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the next request may be sent"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate
+
+        if delay > 0:
+            time.sleep(delay)
+
+class _RateLimitedRetry(Retry):
+    """
+    Retry policy that also waits for the shared rate limiter before each
+    retry, after its backoff, so urllib3's re-sends stay under the limit
+    """
+
+    def __init__(self, limiter=None, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = limiter
+
+    def new(self, **kwargs):
+        # urllib3 copies the policy on every attempt; keep the limiter
+        retry = super().new(**kwargs)
+        retry.limiter = self.limiter
+        return retry
+
+    def sleep(self, response=None):
+        super().sleep(response)
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+class _RateLimitedAdapter(HTTPAdapter):
+    """Adapter that waits for the shared rate limiter before every request it sends"""
+
+    def __init__(self, limiter, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = limiter
+
+    def send(self, request, **kwargs):
+        self.limiter.acquire()
+        return super().send(request, **kwargs)
+
+class _TimeoutSession(requests.Session):
+    """Session that applies REQUEST_TIMEOUT unless the caller passes its own"""
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        return super().request(*args, **kwargs)
+
+def _create_session():
+    """
+    Create the HTTP session shared by PubMed and Bookshelf requests
+
+    Connections to NCBI are kept alive in one pool, sized to the number of
+    requests that may run at once, so only the first request on each
+    connection pays for the TCP and TLS handshake. Every request, and every
+    retry of it, also takes a token from a bucket refilled at
+    REQUESTS_PER_SECOND, which keeps bursts of concurrent fetches under
+    NCBI's limit instead of drawing 429s. Transient failures are retried by
+    the adapter, so callers only see errors that outlast every retry.
+    """
+    limiter = _TokenBucket(REQUESTS_PER_SECOND)
+    session = _TimeoutSession()
+    # Ask for compressed responses; requests and iterparse_url decode them
+    # as they stream in
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'User-Agent': f"{TOOL_NAME} (mailto:{CONTACT_EMAIL})" if CONTACT_EMAIL else TOOL_NAME,
+    })
+    retries = _RateLimitedRetry(
+        limiter,
+        total=MAX_RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False
+    )
+    session.mount('https://', _RateLimitedAdapter(
+        limiter,
+        pool_connections=1,
+        pool_maxsize=MAX_CONCURRENT_REQUESTS,
+        max_retries=retries
+    ))
+    return session
+
+session = _create_session()
+
+def eutils_url(endpoint, **params):
+    """Build an E-utilities URL with properly encoded query parameters"""
+    return f"{EUTILS_BASE_URL}{endpoint}.fcgi?{urlencode({**params, **_COMMON_PARAMS}, safe=',')}"
+
+# Fields that are direct children of their parent use the child axis so
+# lookups don't rescan the whole subtree, and text() returns plain strings
+def text_xpath(path):
+    """Compile an XPath that returns the text of the elements at path"""
+    return etree.XPath(f'{path}/text()', smart_strings=False)
+
+def first_text(xpath, elem, default=None):
+    """Return the first string matched by a compiled text() XPath"""
+    return (xpath(elem) or [default])[0]
+
+class _RecordingReader:
+    """File-like wrapper that keeps a copy of everything read from a stream"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._chunks = []
+
+    def read(self, size=None):
+        chunk = self._stream.read(size if size is not None and size >= 0 else None)
+        self._chunks.append(chunk)
+        return chunk
+
+    def getvalue(self):
+        return b''.join(self._chunks)
+
+def _cache_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+def _cached_body(url):
+    """Return a cached response body for url, or None on a miss"""
+    try:
+        return database.get_cached_response(_cache_key(url), None if OFFLINE else HTTP_CACHE_TTL)
+    except sqlite3.Error as e:
+        logger.warning("HTTP cache lookup failed: %s", e)
+        return None
+
+def _store_body(url, body, response):
+    """Store a response body in the HTTP cache, with its ETag and Last-Modified"""
+    try:
+        database.cache_response(
+            _cache_key(url), body,
+            response.headers.get('ETag'), response.headers.get('Last-Modified')
+        )
+    except sqlite3.Error as e:
+        logger.warning("HTTP cache write failed: %s", e)
+
+def _revalidation(url):
+    """
+    Return (body, headers) for conditionally refetching an expired response
+    
+    If the expired response carried an ETag or Last-Modified, the headers
+    ask the server to answer 304 Not Modified, with no body, when it hasn't
+    changed. Otherwise body is None and headers is empty.
+    """
+    try:
+        cached = database.get_cached_validators(_cache_key(url))
+    except sqlite3.Error as e:
+        logger.warning("HTTP cache lookup failed: %s", e)
+        return None, {}
+    
+    headers = {}
+    if cached is not None:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    return (cached['body'] if headers else None), headers
+
+def _mark_fresh(url):
+    """Restart the TTL of a cached response the server reported unchanged"""
+    try:
+        database.refresh_cached_response(_cache_key(url))
+    except sqlite3.Error as e:
+        logger.warning("HTTP cache write failed: %s", e)
+
+def _check_online(url):
+    """Refuse to go to the network for url in offline mode"""
+    if OFFLINE:
+        raise OfflineCacheMiss(f"No cached response for {url}")
+
+def get_json(url):
+    """
+    GET a JSON response, serving it from the HTTP cache when possible
+    
+    Expired cache entries are revalidated with a conditional request, and
+    a 304 Not Modified reply reuses the cached body.
+    """
+    body = _cached_body(url)
+    if body is None:
+        _check_online(url)
+        stale_body, headers = _revalidation(url)
+        response = session.get(url, headers=headers)
+        if response.status_code == 304 and stale_body is not None:
+            _mark_fresh(url)
+            body = stale_body
+        else:
+            body = response.content
+            if response.ok:
+                _store_body(url, body, response)
+    return orjson.loads(body)
+
+def iterparse_url(url, **kwargs):
+    """
+    Stream an XML response straight into iterparse as bytes arrive,
+    serving it from the HTTP cache when possible
+    
+    Expired cache entries are revalidated with a conditional request, and
+    a 304 Not Modified reply reuses the cached body. A response is only
+    cached once it has been parsed to the end; closing the generator early
+    closes the connection instead of downloading the rest.
+    """
+    body = _cached_body(url)
+    if body is not None:
+        yield from etree.iterparse(io.BytesIO(body), **kwargs)
+        return
+
+    _check_online(url)
+    stale_body, headers = _revalidation(url)
+    with session.get(url, stream=True, headers=headers) as response:
+        if response.status_code == 304 and stale_body is not None:
+            _mark_fresh(url)
+            yield from etree.iterparse(io.BytesIO(stale_body), **kwargs)
+            return
+        
+        response.raw.decode_content = True
+        reader = _RecordingReader(response.raw)
+        yield from etree.iterparse(reader, **kwargs)
+        
+        # Only a body parsed to the end is cached. A caller that stops early
+        # never gets here, and leaving the with block closes the response
+        # without downloading the rest.
+        if response.ok:
+            _store_body(url, reader.getvalue(), response)
+
+def release_element(elem):
+    """Free a processed element and any siblings already handled before it"""
+    elem.clear()
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+def map_concurrently(fetch, items):
+    """
+    Call a blocking fetch function for each item on worker threads
+    
+    At most MAX_CONCURRENT_REQUESTS fetches run at once, sharing the pooled
+    session, and results come back in the same order as items.
+    """
+    items = list(items)
+    if not items:
+        return []
+    
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS, len(items))) as executor:
+        return list(executor.map(fetch, items))
+
+def memoize_search(maxsize):
+    """
+    Decorator that keeps a search function's results for SEARCH_CACHE_TTL seconds
+    
+    Up to maxsize argument tuples are kept, evicting the least recently
+    used. Exceptions propagate and are never cached. The wrapper's
+    cache_clear() empties the cache.
+    """
+    def decorator(search):
+        entries = OrderedDict()  # args -> (expiry time, result)
+        lock = threading.Lock()
+        
+        @wraps(search)
+        def wrapper(*args):
+            with lock:
+                entry = entries.get(args)
+                if entry is not None and entry[0] > time.monotonic():
+                    entries.move_to_end(args)
+                    return entry[1]
+            
+            result = search(*args)
+            with lock:
+                entries[args] = (time.monotonic() + SEARCH_CACHE_TTL, result)
+                entries.move_to_end(args)
+                while len(entries) > maxsize:
+                    entries.popitem(last=False)
+            return result
+        
+        def cache_clear():
+            with lock:
+                entries.clear()
+        
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
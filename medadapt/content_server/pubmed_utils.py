@@ -1,16 +1,121 @@
-import requests
-import xml.etree.ElementTree as ET
-import os
-from dotenv import load_dotenv
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from lxml import etree
+from ncbi_utils import (
+    eutils_url, first_text, get_json, iterparse_url, map_concurrently,
+    memoize_search, release_element, text_xpath
+)
 
-# Load environment variables for API key
-load_dotenv()
-API_KEY = os.getenv('NCBI_API_KEY', '')
+logger = logging.getLogger("medadapt_pubmed")
+
+# XPath expressions relative to a <PubmedArticle>, compiled once
+_PMID = text_xpath('MedlineCitation/PMID')
+_ARTICLE_TITLE = text_xpath('MedlineCitation/Article/ArticleTitle')
+_ABSTRACT_TEXT = text_xpath('MedlineCitation/Article/Abstract/AbstractText')
+_JOURNAL_TITLE = text_xpath('MedlineCitation/Article/Journal/Title')
+_PUB_YEAR = text_xpath('MedlineCitation/Article/Journal/JournalIssue/PubDate/Year')
+_AUTHORS = etree.XPath('MedlineCitation/Article/AuthorList/Author')
+_LAST_NAME = text_xpath('LastName')
+_FORE_NAME = text_xpath('ForeName')
+_MESH_TERMS = text_xpath('MedlineCitation/MeshHeadingList/MeshHeading/DescriptorName')
+
+def _parse_authors(article):
+    """Return author names, 'ForeName LastName', skipping collective authors"""
+    authors = []
+    for author_elem in _AUTHORS(article):
+        last_name = first_text(_LAST_NAME, author_elem)
+        if last_name is None:
+            continue
+        
+        # Build each name in one step; ForeName is only looked up when needed
+        fore_name = first_text(_FORE_NAME, author_elem)
+        authors.append(last_name if fore_name is None else f"{fore_name} {last_name}")
+    return authors
+
+def _parse_article(article):
+    """Extract the metadata common to search results and full records from a <PubmedArticle>"""
+    pmid = first_text(_PMID, article)
+    return {
+        'id': f"pubmed-{pmid}",
+        'title': first_text(_ARTICLE_TITLE, article, "Unknown Title"),
+        'abstract': first_text(_ABSTRACT_TEXT, article),
+        'journal': first_text(_JOURNAL_TITLE, article, "Unknown Journal"),
+        'year': first_text(_PUB_YEAR, article),
+        'authors': _parse_authors(article),
+        'source_type': 'pubmed',
+        'source_id': pmid,
+        'content_type': 'article',
+        'url': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+    }
+
+def _full_record(article, article_elem):
+    """Return the fetch_pubmed_article form of a record parsed by _parse_article"""
+    return {
+        **article,
+        'abstract': article['abstract'] if article['abstract'] is not None else "No abstract available",
+        'year': article['year'] if article['year'] is not None else "Unknown Year",
+        'authors': list(article['authors']),
+        'mesh_terms': _MESH_TERMS(article_elem)
+    }
+
+def iter_pubmed_search(query, max_results=10):
+    """
+    Search PubMed and yield article metadata as each record is parsed
+    
+    Callers that only need the first few hits can stop iterating early,
+    and the remaining records are never turned into dicts. Errors are
+    raised to the caller.
+    
+    The EFetch response already holds each hit's full record, so those
+    records are cached and a following fetch_pubmed_article for a hit
+    needs no request of its own.
+    
+    Args:
+        query: Search terms
+        max_results: Maximum number of results to return
+        
+    Yields:
+        Article metadata, in search rank order
+    """
+    # Step 1: Search for article IDs
+    search_url = eutils_url('esearch', db='pubmed', term=query, retmode='json', retmax=max_results)
+    data = get_json(search_url)
+    
+    pmids = data.get('esearchresult', {}).get('idlist')
+    if not pmids:
+        return
+    
+    # Step 2: Fetch article details
+    fetch_url = eutils_url('efetch', db='pubmed', id=','.join(pmids), retmode='xml')
+    
+    # Parse XML response one <PubmedArticle> at a time
+    for _, article_elem in iterparse_url(fetch_url, events=('end',), tag='PubmedArticle'):
+        article = _parse_article(article_elem)
+        # Skip records without a PMID
+        if article['source_id'] is not None:
+            _article_cache.set(article['source_id'], _full_record(article, article_elem))
+            yield article
+        release_element(article_elem)
+
+# Number of distinct (query, max_results) searches kept in memory
+SEARCH_CACHE_SIZE = 256
+
+@memoize_search(SEARCH_CACHE_SIZE)
+def _cached_search(query, max_results):
+    """Run a search, raising on failure so errors are never cached"""
+    return tuple(iter_pubmed_search(query, max_results))
 
 def search_pubmed(query, max_results=10):
     """
     Search PubMed for articles matching query
     
+    Results are cached in memory for SEARCH_CACHE_TTL seconds, so repeating
+    a search soon after skips the HTTP cache and parsing.
+    Failed searches are not cached; search_pubmed.cache_clear() empties
+    the cache.
+    
     Args:
         query: Search terms
         max_results: Maximum number of results to return
@@ -18,144 +123,139 @@ def search_pubmed(query, max_results=10):
     Returns:
         List of article metadata
     """
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-    api_params = f"&api_key={API_KEY}" if API_KEY else ""
+    try:
+        # Callers get their own copy so they can't alter the cached results
+        return copy.deepcopy(list(_cached_search(query, max_results)))
+    except Exception as e:
+        logger.error("Error searching PubMed: %s", e)
+        return []
+
+search_pubmed.cache_clear = _cached_search.cache_clear
+
+# Number of parsed articles kept in memory by fetch_pubmed_articles_bulk
+ARTICLE_CACHE_SIZE = 1024
+
+# Most PMIDs requested in one EFetch call; NCBI recommends at most 200 per GET
+EFETCH_BATCH_SIZE = 200
+
+class _ArticleCache:
+    """Thread-safe LRU cache of parsed articles keyed by PMID"""
     
-    # Step 1: Search for article IDs
-    search_url = f"{base_url}esearch.fcgi?db=pubmed&term={query}&retmode=json&retmax={max_results}{api_params}"
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
     
+    def get(self, pmid):
+        with self._lock:
+            article = self._entries.get(pmid)
+            if article is not None:
+                self._entries.move_to_end(pmid)
+            return article
+    
+    def set(self, pmid, article):
+        with self._lock:
+            self._entries[pmid] = article
+            self._entries.move_to_end(pmid)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+_article_cache = _ArticleCache(ARTICLE_CACHE_SIZE)
+
+def _fetch_batch(pmids):
+    """
+    Fetch and parse up to EFETCH_BATCH_SIZE articles with one EFetch call
+    
+    Returns a dict of PMID to full article record. PMIDs that EFetch did not
+    return are left out, and request errors are raised to the caller.
+    """
+    fetch_url = eutils_url('efetch', db='pubmed', id=','.join(pmids), retmode='xml')
+    articles = {}
+    
+    for _, article_elem in iterparse_url(fetch_url, events=('end',), tag='PubmedArticle'):
+        article = _parse_article(article_elem)
+        if article['source_id'] is not None:
+            articles[article['source_id']] = _full_record(article, article_elem)
+        release_element(article_elem)
+    
+    return articles
+
+def _fetch_batch_or_error(pmids):
+    """Fetch a batch, returning the error message instead of raising"""
     try:
-        response = requests.get(search_url)
-        data = response.json()
-        
-        if 'esearchresult' not in data or 'idlist' not in data['esearchresult']:
-            return []
-            
-        pmids = data['esearchresult']['idlist']
-        
-        if not pmids:
-            return []
-        
-        # Step 2: Fetch article details
-        fetch_url = f"{base_url}efetch.fcgi?db=pubmed&id={','.join(pmids)}&retmode=xml{api_params}"
-        fetch_response = requests.get(fetch_url)
-        
-        # Parse XML response
-        root = ET.fromstring(fetch_response.text)
-        articles = []
-        
-        for article in root.findall('.//PubmedArticle'):
-            # Extract article metadata
-            pmid_elem = article.find('.//PMID')
-            if pmid_elem is None:
-                continue
-                
-            pmid = pmid_elem.text
-            
-            # Title
-            title_elem = article.find('.//ArticleTitle')
-            title = title_elem.text if title_elem is not None else "Unknown Title"
-            
-            # Abstract
-            abstract_elem = article.find('.//AbstractText')
-            abstract = abstract_elem.text if abstract_elem is not None else None
-            
-            # Journal
-            journal_elem = article.find('.//Journal/Title')
-            journal = journal_elem.text if journal_elem is not None else "Unknown Journal"
-            
-            # Year
-            year_elem = article.find('.//PubDate/Year')
-            year = year_elem.text if year_elem is not None else None
-            
-            # Authors
-            authors = []
-            for author_elem in article.findall('.//Author'):
-                last_name = author_elem.find('LastName')
-                fore_name = author_elem.find('ForeName')
-                if last_name is not None:
-                    author_name = last_name.text
-                    if fore_name is not None:
-                        author_name = f"{fore_name.text} {author_name}"
-                    authors.append(author_name)
-            
-            articles.append({
-                'id': f"pubmed-{pmid}",
-                'title': title,
-                'abstract': abstract,
-                'journal': journal,
-                'year': year,
-                'authors': authors,
-                'source_type': 'pubmed',
-                'source_id': pmid,
-                'content_type': 'article',
-                'url': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-            })
-        
-        return articles
+        return _fetch_batch(pmids), None
     except Exception as e:
-        print(f"Error searching PubMed: {e}")
-        return []
+        logger.error("Error fetching PubMed articles: %s", e)
+        return {}, f"Error fetching article: {e}"
+
+def fetch_pubmed_articles_bulk(pmids):
+    """
+    Fetch complete article details for many PubMed IDs
+    
+    PMIDs not already cached in memory are requested in batches of
+    EFETCH_BATCH_SIZE, one EFetch call per batch, and the batches are
+    fetched in parallel. Articles that were found are cached; missing
+    articles and failed batches are not.
+    
+    Args:
+        pmids: PubMed IDs to fetch
+        
+    Returns:
+        Dict mapping each PMID (as a string) to its article metadata, or to
+        an {"error": ...} dict if it could not be fetched
+    """
+    pmids = list(dict.fromkeys(str(pmid) for pmid in pmids))
+    articles = {}
+    missing = []
+    
+    for pmid in pmids:
+        article = _article_cache.get(pmid)
+        if article is None:
+            missing.append(pmid)
+        else:
+            articles[pmid] = article
+    
+    batches = [missing[i:i + EFETCH_BATCH_SIZE] for i in range(0, len(missing), EFETCH_BATCH_SIZE)]
+    errors = {}
+    
+    for batch, (fetched, error) in zip(batches, map_concurrently(_fetch_batch_or_error, batches)):
+        for pmid, article in fetched.items():
+            _article_cache.set(pmid, article)
+        articles.update(fetched)
+        if error is not None:
+            errors.update(dict.fromkeys(batch, error))
+    
+    # Callers get their own copies so they can't alter the cached articles
+    return {
+        pmid: copy.deepcopy(articles[pmid]) if pmid in articles
+        else {"error": errors.get(pmid, "Article not found")}
+        for pmid in pmids
+    }
 
 def fetch_pubmed_article(pmid):
     """
     Fetch complete article details by PubMed ID
     
+    Parsed articles are cached in memory, so repeated lookups of the same
+    PMID skip the network round trip. Failed lookups are not cached.
+    
     Args:
         pmid: PubMed ID
         
     Returns:
         Complete article metadata
     """
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-    api_params = f"&api_key={API_KEY}" if API_KEY else ""
-    
-    fetch_url = f"{base_url}efetch.fcgi?db=pubmed&id={pmid}&retmode=xml{api_params}"
+    return fetch_pubmed_articles_bulk([pmid])[str(pmid)]
+
+def fetch_pubmed_articles(pmids):
+    """
+    Fetch several articles, batching PMIDs into bulk EFetch calls
     
-    try:
-        response = requests.get(fetch_url)
-        root = ET.fromstring(response.text)
-        
-        article_elem = root.find('.//PubmedArticle')
-        if article_elem is None:
-            return {"error": "Article not found"}
-        
-        # Extract article metadata
-        title_elem = article_elem.find('.//ArticleTitle')
-        abstract_elem = article_elem.find('.//AbstractText')
-        journal_elem = article_elem.find('.//Journal/Title')
-        year_elem = article_elem.find('.//PubDate/Year')
-        
-        authors = []
-        for author_elem in article_elem.findall('.//Author'):
-            last_name = author_elem.find('LastName')
-            fore_name = author_elem.find('ForeName')
-            if last_name is not None:
-                author_name = last_name.text
-                if fore_name is not None:
-                    author_name = f"{fore_name.text} {author_name}"
-                authors.append(author_name)
-        
-        # Extract mesh terms
-        mesh_terms = []
-        for mesh_elem in article_elem.findall('.//MeshHeading'):
-            descriptor = mesh_elem.find('DescriptorName')
-            if descriptor is not None:
-                mesh_terms.append(descriptor.text)
+    Args:
+        pmids: PubMed IDs to fetch
         
-        return {
-            'id': f"pubmed-{pmid}",
-            'title': title_elem.text if title_elem is not None else "Unknown Title",
-            'abstract': abstract_elem.text if abstract_elem is not None else "No abstract available",
-            'authors': authors,
-            'journal': journal_elem.text if journal_elem is not None else "Unknown Journal",
-            'year': year_elem.text if year_elem is not None else "Unknown Year",
-            'mesh_terms': mesh_terms,
-            'source_type': 'pubmed',
-            'source_id': pmid,
-            'content_type': 'article',
-            'url': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-        }
-    except Exception as e:
-        print(f"Error fetching PubMed article: {e}")
-        return {"error": f"Error fetching article: {e}"} 
\ No newline at end of file
+    Returns:
+        List of article metadata, in the same order as pmids
+    """
+    articles = fetch_pubmed_articles_bulk(pmids)
+    return [articles[str(pmid)] for pmid in pmids]
@@ -11,6 +11,9 @@ import argparse
 import logging
 import time
 import importlib
+import importlib.util
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import test_server
 
 # Configure logging
@@ -24,6 +27,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger("medadapt_test_runner")
 
+@lru_cache(maxsize=None)
+def _load_module(module_name):
+    """
+    Import a module once per process, or return None if it isn't available
+    
+    find_spec checks availability without running the module, and the
+    cache keeps repeated runs from importing it again.
+    """
+    if importlib.util.find_spec(module_name) is None:
+        return None
+    
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        # The module exists but one of its own dependencies is missing
+        return None
+
 def run_unit_tests():
     """Run unit tests for each module"""
     logger.info("Running unit tests...")
@@ -32,17 +52,16 @@ def run_unit_tests():
     test_suite = unittest.TestSuite()
     
     # Find and add test cases
-    for module_name in ['database', 'pubmed_utils', 'bookshelf_utils', 'backup_utils']:
-        try:
-            # Try to import the module
-            module = importlib.import_module(module_name)
-            
-            # Look for test_* functions in the module
-            for attr_name in dir(module):
-                if attr_name.startswith('test_') and callable(getattr(module, attr_name)):
-                    test_suite.addTest(unittest.FunctionTestCase(getattr(module, attr_name)))
-        except ImportError:
+    for module_name in ['database', 'ncbi_utils', 'pubmed_utils', 'bookshelf_utils', 'backup_utils']:
+        module = _load_module(module_name)
+        if module is None:
             logger.warning(f"Could not import module '{module_name}' for unit testing")
+            continue
+        
+        # Look for test_* functions in the module
+        for attr_name in dir(module):
+            if attr_name.startswith('test_') and callable(getattr(module, attr_name)):
+                test_suite.addTest(unittest.FunctionTestCase(getattr(module, attr_name)))
     
     # Run the tests
     test_runner = unittest.TextTestRunner(verbosity=2)
@@ -63,31 +82,40 @@ def run_performance_tests():
     try:
         import database
         
+        # Raw perf_counter_ns deltas per operation, formatted once at the end
+        timings = {}
+        
         # Test database performance
-        start_time = time.time()
+        start = time.perf_counter_ns()
         database.initialize_database()
-        init_time = time.time() - start_time
-        logger.info(f"Database initialization time: {init_time:.2f} seconds")
+        timings['init'] = time.perf_counter_ns() - start
         
-        # Test resource addition performance
-        start_time = time.time()
-        for i in range(10):
-            test_resource = {
+        # Test resource addition performance; add_resources writes every
+        # row with one executemany in a single WAL transaction
+        test_resources = [
+            {
                 'id': f'perf-test-resource-{i}',
                 'title': f'Performance Test Resource {i}',
                 'source_type': 'test',
                 'content_type': 'article',
                 'cached_content': {'content': f'This is performance test resource {i}.'}
             }
-            database.add_resource(test_resource)
-        add_time = time.time() - start_time
-        logger.info(f"Adding 10 resources time: {add_time:.2f} seconds (avg: {add_time/10:.4f}s per resource)")
+            for i in range(10)
+        ]
+        start = time.perf_counter_ns()
+        database.add_resources(test_resources)
+        timings['add'] = time.perf_counter_ns() - start
         
         # Test search performance
-        start_time = time.time()
+        start = time.perf_counter_ns()
         database.search_resources(query='test')
-        search_time = time.time() - start_time
-        logger.info(f"Search operation time: {search_time:.4f} seconds")
+        timings['search'] = time.perf_counter_ns() - start
+        
+        init_time, add_time, search_time = (timings[name] / 1e9 for name in ('init', 'add', 'search'))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Database initialization time: {init_time:.2f} seconds")
+            logger.info(f"Adding 10 resources time: {add_time:.2f} seconds (avg: {add_time/10:.4f}s per resource)")
+            logger.info(f"Search operation time: {search_time:.4f} seconds")
         
         # Determine if tests were successful based on performance thresholds
         success = (init_time < 1.0 and add_time < 2.0 and search_time < 1.0)
@@ -112,8 +140,8 @@ def run_api_tests():
         
         # Test PubMed API
         try:
-            results = pubmed_utils.search_pubmed('test', 1)
-            if results and len(results) > 0:
+            # Only one hit is needed, so stop after the first parsed record
+            if next(pubmed_utils.iter_pubmed_search('test', 1), None) is not None:
                 logger.info("PubMed API connection successful")
                 pubmed_success = True
             else:
@@ -151,22 +179,24 @@ def main():
     # If no specific test type is specified, run all tests
     run_all = args.all or not (args.unit or args.integration or args.performance or args.api)
     
-    # Track results
-    results = {}
-    
-    # Run tests based on arguments
-    if args.unit or run_all:
-        results['unit'] = run_unit_tests()
-    
-    if args.integration or run_all:
-        results['integration'] = run_integration_tests()
+    # Select test suites based on arguments
+    suites = {
+        'unit': run_unit_tests,
+        'integration': run_integration_tests,
+        'api': run_api_tests,
+    }
+    selected = {name: suite for name, suite in suites.items() if getattr(args, name) or run_all}
+    
+    # The suites are independent and mostly wait on the network, so run
+    # them concurrently. Performance tests run afterwards on their own so
+    # their timings aren't skewed by the other suites.
+    with ThreadPoolExecutor(max_workers=max(len(selected), 1)) as executor:
+        futures = {name: executor.submit(suite) for name, suite in selected.items()}
+        results = {name: future.result() for name, future in futures.items()}
     
     if args.performance or run_all:
         results['performance'] = run_performance_tests()
     
-    if args.api or run_all:
-        results['api'] = run_api_tests()
-    
     # Print summary
     logger.info("\n=== Test Results Summary ===")
     for test_type, passed in results.items():
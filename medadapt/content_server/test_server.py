@@ -1,87 +1,99 @@
 import database
-from pubmed_utils import search_pubmed, fetch_pubmed_article
-from bookshelf_utils import search_bookshelf, fetch_bookshelf_content
 import os
 import logging
 import time
-import json
+import tempfile
+import orjson
+import pytest
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("test_results.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("medadapt_tests")
 
+# Sample responses are only saved to disk when MEDADAPT_DUMP_ARTIFACTS is set,
+# and are written compact unless MEDADAPT_DEBUG asks for readable output
+DUMP_ARTIFACTS = bool(os.getenv('MEDADAPT_DUMP_ARTIFACTS'))
+JSON_DUMP_OPTIONS = orjson.OPT_INDENT_2 if os.getenv('MEDADAPT_DEBUG') else 0
+
+def write_json(path, data):
+    """Write data to path as JSON for later analysis"""
+    if not DUMP_ARTIFACTS:
+        return
+    
+    # Serialize in one call and hand the bytes to a large buffer so even
+    # multi-megabyte books go out in a few writes
+    with open(path, "wb", buffering=1 << 20) as f:
+        f.write(orjson.dumps(data, option=JSON_DUMP_OPTIONS))
+
 def test_database():
     """Test database functionality with comprehensive checks"""
     logger.info("Testing database functionality...")
     
-    # Initialize database
-    try:
+    # Run against a throwaway in-memory database, so the test never
+    # touches the disk or leaves test rows behind in the real one
+    with database.temporary_database():
+        # Initialize database
         database.initialize_database()
         logger.info("✓ Database initialization successful")
-    except Exception as e:
-        logger.error(f"✗ Database initialization failed: {str(e)}")
-        return False
-    
-    # Test resource operations
-    test_resource = {
-        'id': 'test-resource-001',
-        'title': 'Test Resource for Database Operations',
-        'source_type': 'test',
-        'specialty': 'cardiology',
-        'difficulty': 'intermediate',
-        'content_type': 'article',
-        'cached_content': {'content': 'This is a test resource for database operations.'}
-    }
-    
-    try:
+        
+        # Test resource operations
+        test_resource = {
+            'id': 'test-resource-001',
+            'title': 'Test Resource for Database Operations',
+            'source_type': 'test',
+            'specialty': 'cardiology',
+            'difficulty': 'intermediate',
+            'content_type': 'article',
+            'cached_content': {'content': 'This is a test resource for database operations.'}
+        }
+        
         # Add resource
         database.add_resource(test_resource)
         logger.info("✓ Database add resource successful")
         
         # Retrieve resource
         retrieved = database.get_resource('test-resource-001')
-        
-        if retrieved and retrieved['title'] == 'Test Resource for Database Operations':
-            logger.info("✓ Database retrieve resource successful")
-        else:
-            logger.error("✗ Database retrieve resource failed")
-            return False
+        assert retrieved and retrieved['title'] == 'Test Resource for Database Operations', \
+            "Database retrieve resource failed"
+        logger.info("✓ Database retrieve resource successful")
         
         # Test search
         search_results = database.search_resources(query='test')
-        
-        if search_results and len(search_results) > 0:
-            logger.info(f"✓ Database search successful, found {len(search_results)} results")
-        else:
-            logger.error("✗ Database search failed")
-            return False
+        assert search_results, "Database search failed"
+        logger.info(f"✓ Database search successful, found {len(search_results)} results")
         
         # Test filtering
         filter_results = database.search_resources(
             specialty='cardiology', 
             difficulty='intermediate'
         )
+        assert any(r['id'] == 'test-resource-001' for r in filter_results), "Database filtering failed"
+        logger.info("✓ Database filtering successful")
+
+        # Test that filtered searches use the composite filter index
+        plan = database.get_db_connection().execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM resources "
+            "WHERE specialty = ? AND difficulty = ? AND content_type = ? "
+            "ORDER BY access_count DESC LIMIT 10",
+            ('cardiology', 'intermediate', 'article')
+        ).fetchall()
+        assert any('idx_resources_filter' in row[-1] for row in plan), \
+            f"Database filter index not used: {[row[-1] for row in plan]}"
+        logger.info("✓ Database filter index used")
+
+        # Test bulk add; every row is written in one transaction
+        bulk_count = 100
+        database.add_resources(
+            dict(test_resource, id=f'test-bulk-resource-{i}', title=f'Bulk Test Resource {i}')
+            for i in range(bulk_count)
+        )
+        stored = database.get_db_connection().execute(
+            "SELECT COUNT(*) FROM resources WHERE id LIKE 'test-bulk-resource-%'"
+        ).fetchone()[0]
+        assert stored == bulk_count, f"Database bulk add failed: {stored} of {bulk_count} rows stored"
+        logger.info(f"✓ Database bulk add of {bulk_count} resources successful")
         
-        if filter_results and any(r['id'] == 'test-resource-001' for r in filter_results):
-            logger.info("✓ Database filtering successful")
-        else:
-            logger.error("✗ Database filtering failed")
-            return False
-            
-    except Exception as e:
-        logger.error(f"✗ Database operation failed: {str(e)}")
-        return False
-    
-    # Test topic mappings
-    try:
-        # Add topic mapping
+        # Test topic mappings
         database.add_topic_mapping(
             "test_topic", 
             "test_parent_topic", 
@@ -91,20 +103,10 @@ def test_database():
         
         # Get related topics
         related = database.get_related_topics("test_topic")
+        assert related and "test_parent_topic" in related, "Topic mapping operations failed"
+        logger.info("✓ Topic mapping operations successful")
         
-        if related and "test_parent_topic" in related:
-            logger.info("✓ Topic mapping operations successful")
-        else:
-            logger.error("✗ Topic mapping operations failed")
-            return False
-            
-    except Exception as e:
-        logger.error(f"✗ Topic mapping operation failed: {str(e)}")
-        return False
-    
-    # Test user documents
-    try:
-        # Add user document
+        # Test user documents
         doc_id = database.add_user_document(
             "Test User Document",
             "This is content for a test user document."
@@ -112,136 +114,100 @@ def test_database():
         
         # Retrieve user document
         doc = database.get_user_document(doc_id)
-        
-        if doc and doc['title'] == "Test User Document":
-            logger.info("✓ User document operations successful")
-        else:
-            logger.error("✗ User document operations failed")
-            return False
-            
-    except Exception as e:
-        logger.error(f"✗ User document operation failed: {str(e)}")
-        return False
-    
-    return True
+        assert doc and doc['title'] == "Test User Document", "User document operations failed"
+        logger.info("✓ User document operations successful")
 
-def test_pubmed(retry_count=2, delay=1.0):
-    """Test PubMed API functionality with retries"""
-    logger.info("Testing PubMed API functionality...")
-    
-    # Test search with retries
-    results = None
+        # Test HTTP response cache
+        database.cache_response('test-url-hash', b'<Root/>')
+        cached = database.get_cached_response('test-url-hash', 60)
+        assert cached == b'<Root/>', "HTTP cache operations failed"
+        logger.info("✓ HTTP cache operations successful")
+
+def test_database_wal(tmp_path):
+    """Test that initialize_database puts a database file in WAL mode"""
+    # Grouped commits rely on WAL so they don't wait on a full fsync. An
+    # in-memory database has no journal, so check a throwaway file instead.
+    with database.temporary_database(str(tmp_path / "wal_check.db")) as conn:
+        database.initialize_database()
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert journal_mode == 'wal', f"Database not in WAL mode: {journal_mode}"
+    logger.info("✓ Database WAL journal mode enabled")
+
+def _with_retries(call, description, retry_count, delay):
+    """Return call(), retrying up to retry_count times if it raises"""
     for attempt in range(retry_count + 1):
         try:
-            results = search_pubmed('cardiac cycle', 2)
-            break
+            return call()
         except Exception as e:
-            if attempt < retry_count:
-                logger.warning(f"PubMed search attempt {attempt+1} failed: {str(e)}. Retrying in {delay}s...")
-                time.sleep(delay)
-            else:
-                logger.error(f"PubMed search failed after {retry_count+1} attempts: {str(e)}")
-                return False
+            if attempt == retry_count:
+                logger.error(f"{description} failed after {retry_count+1} attempts: {str(e)}")
+                raise
+            logger.warning(f"{description} attempt {attempt+1} failed: {str(e)}. Retrying in {delay}s...")
+            time.sleep(delay)
+
+# (query, max_results) pairs exercised by test_pubmed
+PUBMED_QUERIES = [('cardiac cycle', 2), ('hypertension', 3)]
+
+@pytest.mark.network
+@pytest.mark.parametrize('query, max_results', PUBMED_QUERIES)
+def test_pubmed(query, max_results, retry_count=2, delay=1.0):
+    """Test PubMed API functionality with retries"""
+    # Imported here so the database test doesn't load the HTTP and XML stack
+    from pubmed_utils import search_pubmed, fetch_pubmed_articles
     
-    if results and len(results) > 0:
-        logger.info(f"✓ PubMed search returned {len(results)} results")
-        logger.info(f"  First result: {results[0]['title']}")
-        
-        # Store the search results for later analysis
-        with open("pubmed_search_results.json", "w") as f:
-            json.dump(results, f, indent=4)
-    else:
-        logger.error("✗ PubMed search returned no results")
-        return False
+    logger.info(f"Testing PubMed API functionality for '{query}'...")
     
-    # Test article fetch with retries
-    if results and len(results) > 0:
-        pmid = results[0]['source_id']
-        article = None
-        
-        for attempt in range(retry_count + 1):
-            try:
-                article = fetch_pubmed_article(pmid)
-                break
-            except Exception as e:
-                if attempt < retry_count:
-                    logger.warning(f"PubMed article fetch attempt {attempt+1} failed: {str(e)}. Retrying in {delay}s...")
-                    time.sleep(delay)
-                else:
-                    logger.error(f"PubMed article fetch failed after {retry_count+1} attempts: {str(e)}")
-                    return False
-        
-        if article and 'error' not in article:
-            logger.info(f"✓ PubMed article fetch successful")
-            
-            # Store the article for later analysis
-            with open("pubmed_article_sample.json", "w") as f:
-                json.dump(article, f, indent=4)
-        else:
-            logger.error(f"✗ PubMed article fetch failed: {article.get('error', 'Unknown error')}")
-            return False
+    # Test search with retries
+    results = _with_retries(lambda: search_pubmed(query, max_results), "PubMed search", retry_count, delay)
+    assert results, "PubMed search returned no results"
+    logger.info(f"✓ PubMed search returned {len(results)} results")
+    logger.info(f"  First result: {results[0]['title']}")
     
-    return True
+    # Store the search results for later analysis
+    write_json("pubmed_search_results.json", results)
+    
+    # Test article fetch with retries, fetching every hit at once
+    pmids = [result['source_id'] for result in results]
+    articles = _with_retries(lambda: fetch_pubmed_articles(pmids), "PubMed article fetch", retry_count, delay)
+    errors = [article['error'] for article in articles if 'error' in article]
+    assert not errors, f"PubMed article fetch failed: {errors[0]}"
+    logger.info(f"✓ PubMed article fetch successful for {len(articles)} articles")
+    
+    # Store the article for later analysis
+    write_json("pubmed_article_sample.json", articles[0])
 
+@pytest.mark.network
 def test_bookshelf(retry_count=2, delay=1.0):
     """Test Bookshelf API functionality with retries"""
+    # Imported here so the database test doesn't load the HTTP and XML stack
+    from bookshelf_utils import search_bookshelf, fetch_bookshelf_contents
+    
     logger.info("Testing Bookshelf API functionality...")
     
     # Test search with retries
-    results = None
-    for attempt in range(retry_count + 1):
-        try:
-            results = search_bookshelf('cardiovascular system', 2)
-            break
-        except Exception as e:
-            if attempt < retry_count:
-                logger.warning(f"Bookshelf search attempt {attempt+1} failed: {str(e)}. Retrying in {delay}s...")
-                time.sleep(delay)
-            else:
-                logger.error(f"Bookshelf search failed after {retry_count+1} attempts: {str(e)}")
-                return False
+    results = _with_retries(lambda: search_bookshelf('cardiovascular system', 2), "Bookshelf search",
+                            retry_count, delay)
+    assert results, "Bookshelf search returned no results"
+    logger.info(f"✓ Bookshelf search returned {len(results)} results")
+    logger.info(f"  First result: {results[0]['title']}")
     
-    if results and len(results) > 0:
-        logger.info(f"✓ Bookshelf search returned {len(results)} results")
-        logger.info(f"  First result: {results[0]['title']}")
-        
-        # Store the search results for later analysis
-        with open("bookshelf_search_results.json", "w") as f:
-            json.dump(results, f, indent=4)
-    else:
-        logger.error("✗ Bookshelf search returned no results")
-        return False
+    # Store the search results for later analysis
+    write_json("bookshelf_search_results.json", results)
     
-    # Test book fetch with retries
-    if results and len(results) > 0:
-        book_id = results[0]['source_id']
-        book = None
-        
-        for attempt in range(retry_count + 1):
-            try:
-                book = fetch_bookshelf_content(book_id)
-                break
-            except Exception as e:
-                if attempt < retry_count:
-                    logger.warning(f"Bookshelf content fetch attempt {attempt+1} failed: {str(e)}. Retrying in {delay}s...")
-                    time.sleep(delay)
-                else:
-                    logger.error(f"Bookshelf content fetch failed after {retry_count+1} attempts: {str(e)}")
-                    return False
-        
-        if book and 'error' not in book:
-            logger.info(f"✓ Bookshelf content fetch successful")
-            if book.get('chapters') and len(book['chapters']) > 0:
-                logger.info(f"  Book has {len(book['chapters'])} chapters")
-                
-                # Store the book for later analysis
-                with open("bookshelf_book_sample.json", "w") as f:
-                    json.dump(book, f, indent=4)
-        else:
-            logger.error(f"✗ Bookshelf content fetch failed: {book.get('error', 'Unknown error')}")
-            return False
+    # Test book fetch with retries, fetching every hit in parallel
+    book_ids = [result['source_id'] for result in results]
+    books = _with_retries(lambda: fetch_bookshelf_contents(book_ids), "Bookshelf content fetch",
+                          retry_count, delay)
+    errors = [book['error'] for book in books if 'error' in book]
+    assert not errors, f"Bookshelf content fetch failed: {errors[0]}"
+    logger.info(f"✓ Bookshelf content fetch successful for {len(books)} books")
     
-    return True
+    book = books[0]
+    if book.get('chapters'):
+        logger.info(f"  Book has {len(book['chapters'])} chapters")
+        
+        # Store the book for later analysis
+        write_json("bookshelf_book_sample.json", book)
 
 def test_environment():
     """Verify environmental setup and configuration"""
@@ -256,24 +222,24 @@ def test_environment():
     
     # Check for database file or ability to create it
     db_dir = os.path.dirname(os.path.abspath('medadapt_content.db'))
-    if os.access(db_dir, os.W_OK):
-        logger.info(f"✓ Write access available for database directory: {db_dir}")
-    else:
-        logger.error(f"✗ No write access for database directory: {db_dir}")
-        return False
+    assert os.access(db_dir, os.W_OK), f"No write access for database directory: {db_dir}"
+    logger.info(f"✓ Write access available for database directory: {db_dir}")
     
     # Check required modules
+    import sqlite3
+    import requests
+    import dotenv
+    import mcp
+    logger.info("✓ All required modules are available")
+
+def _passed(test, *args):
+    """Run a test function outside pytest, logging why it failed"""
     try:
-        import sqlite3
-        import requests
-        import dotenv
-        import mcp
-        logger.info("✓ All required modules are available")
-    except ImportError as e:
-        logger.error(f"✗ Required module missing: {str(e)}")
+        test(*args)
+        return True
+    except Exception as e:
+        logger.error(f"✗ {test.__name__} failed: {str(e)}")
         return False
-    
-    return True
 
 def run_all_tests():
     """Run all tests and return overall status"""
@@ -288,10 +254,24 @@ def run_all_tests():
     }
     
     # Run tests
-    results["environment"] = test_environment()
-    results["database"] = test_database()
-    results["pubmed"] = test_pubmed()
-    results["bookshelf"] = test_bookshelf()
+    results["environment"] = _passed(test_environment)
+    
+    # Create the schema up front so the API tests' HTTP cache lookups
+    # don't race the database test's own initialization
+    database.initialize_database()
+    
+    # The database, PubMed and Bookshelf tests are independent, and each
+    # worker thread gets its own SQLite connection, so run them together
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tests = {
+            "database": [(test_database,), (test_database_wal, Path(tmp_dir))],
+            "pubmed": [(test_pubmed, *params) for params in PUBMED_QUERIES],
+            "bookshelf": [(test_bookshelf,)],
+        }
+        with ThreadPoolExecutor(max_workers=sum(len(runs) for runs in tests.values())) as executor:
+            futures = {name: [executor.submit(_passed, *run) for run in runs] for name, runs in tests.items()}
+            for name, pending in futures.items():
+                results[name] = all([future.result() for future in pending])
     
     # Summarize results
     logger.info("\n=== Test Results Summary ===")
@@ -305,4 +285,13 @@ def run_all_tests():
     return all_passed
 
 if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("test_results.log"),
+            logging.StreamHandler()
+        ]
+    )
     run_all_tests() 
\ No newline at end of file